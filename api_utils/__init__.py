@@ -0,0 +1 @@
+"""Helpers shared by the API scripts of this repository."""
@@ -0,0 +1,39 @@
+"""
+Command line options shared by the scripts in this repository.
+
+- `add_run_arguments()`: ``--metrics`` (the file of the run metrics, see `metrics.export()`) and ``--no-cache``
+  (always fetch, without `response_cache`).
+- `start_run()`: applies ``--no-cache``.
+- `finish_run()`: saves the run metrics to the ``--metrics`` file, nothing if it is empty.
+
+Usage:
+    from api_utils import cli
+    cli.add_run_arguments(parser, metrics_filename)
+    args = parser.parse_args(argv)
+    cli.start_run(args)
+    ...
+    cli.finish_run(args)
+"""
+
+
+import logging
+
+from . import metrics, response_cache
+
+logger = logging.getLogger(__name__)
+
+def add_run_arguments(parser, metrics_file=None, cache=True):
+    """Add ``--metrics`` (default ``metrics_file``, None = not saved) and, for a script calling APIs, ``--no-cache``."""
+    parser.add_argument('--metrics', default=metrics_file,
+                        help='file of the run metrics (.json or .prom)' + ('' if metrics_file else ', not saved by default'))
+    if cache:
+        parser.add_argument('--no-cache', action='store_true', help='always fetch, without the local response cache')
+
+def start_run(args):
+    if getattr(args, 'no_cache', False):
+        response_cache.configure(enabled=False)
+
+def finish_run(args):
+    if args.metrics:
+        metrics.export(args.metrics)
+        logger.info('run metrics saved to %s', args.metrics)
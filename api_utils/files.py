@@ -0,0 +1,26 @@
+"""
+File writes shared by the scripts in this repository, for the state files a later run reads again
+(checkpoints, change-tracking state, saved API documents).
+
+- `write_text()` / `write_json()`: the content is written to a temporary file next to the target, which then replaces
+  the target in one step, so an interrupted run leaves either the old or the new file and never a half-written one.
+
+Usage:
+    from api_utils import files
+    files.write_json('reviews_checkpoint.json', {'stores': stores}, indent=2)
+"""
+
+
+import os
+import json
+
+def write_text(fn, text):
+    """Replace ``fn`` with ``text`` (UTF-8) in one step."""
+    tmp_fn = fn + '.tmp'
+    with open(tmp_fn, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_fn, fn)
+
+def write_json(fn, data, indent=None):
+    """Replace ``fn`` with ``data`` as JSON in one step."""
+    write_text(fn, json.dumps(data, ensure_ascii=False, indent=indent))
@@ -0,0 +1,256 @@
+"""
+Shared HTTP client for all API calls of the scripts in this repository.
+
+- Connection pooling and keep-alive: one `requests.Session` per thread, so the pages of a paginated API reuse the same TCP / TLS connection.
+- HTTP/2: a single `httpx.Client` is used instead for ``https://`` URLs when `http2` is enabled and httpx is installed with the h2 extra
+  (``pip install httpx[http2]``). HTTP/2 is only negotiated over TLS, so ``http://`` URLs always use the faster requests session.
+- Timeouts: `timeout` is applied to every request that does not set its own.
+- Retries: connection errors, timeouts and `retry_statuses` responses are retried with exponential backoff and jitter.
+- `build_http()`: an `httplib2.Http` with the same timeout for googleapiclient, which keeps its connections alive by itself.
+- Metrics: every call (also of `build_http()`) is recorded in `metrics` with its latency, status code, response bytes and retries.
+- Cache: a request with a ``cache_ttl`` (or a `build_http()` endpoint in ``cache_ttls``) is served from `response_cache`
+  while it is fresh, and revalidated with its ETag / Last-Modified when it has expired.
+
+Usage:
+    from api_utils import http_client
+    response = http_client.request('GET', url, params=params)
+    response = http_client.request('GET', url, params=params, cache_ttl=3600) # served from the cache for an hour
+"""
+
+
+import re
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlparse
+
+from . import metrics, response_cache
+from .lazy import lazy_import
+requests = lazy_import('requests') # imported with the first request
+
+logger = logging.getLogger(__name__)
+
+# Set up the client
+timeout = (10, 60)              # connect / read timeout in seconds
+pool_maxsize = 20               # connections kept alive per host
+max_retries = 3                 # retries for connection errors, timeouts and retry_statuses
+backoff_factor = 0.5            # wait backoff_factor * 2 ** attempt seconds (plus jitter) between retries
+retry_statuses = (500, 502, 504)
+http2 = True                    # use HTTP/2 when httpx and h2 are installed
+
+local = threading.local()
+httpx_client = None
+httpx_lock = threading.Lock()
+httpx_installed = None
+
+def configure(**settings):
+    """Change the client settings above, the clients are created again with the new settings."""
+    global httpx_client
+    for key, value in settings.items():
+        if key not in {'timeout', 'pool_maxsize', 'max_retries', 'backoff_factor', 'retry_statuses', 'http2'}:
+            raise ValueError(f'unknown http_client setting: {key}')
+        globals()[key] = value
+    local.__dict__.clear()
+    httpx_client = None
+
+def use_http2():
+    """Return True if HTTP/2 is enabled and httpx with h2 is installed."""
+    global httpx_installed
+    if httpx_installed is None:
+        try:
+            import httpx
+            import h2
+            httpx_installed = True
+        except ImportError:
+            httpx_installed = False
+    return http2 and httpx_installed
+
+def split_timeout(value):
+    """Return the (connect, read) timeout from a number or a tuple."""
+    if isinstance(value, tuple):
+        return value
+    return value, value
+
+def get_session():
+    """Return the pooled requests session of the current thread."""
+    session = getattr(local, 'session', None)
+    if session is None:
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        local.session = session
+    return session
+
+def get_httpx_client():
+    """Return the HTTP/2 client shared by all threads (httpx clients are thread-safe)."""
+    global httpx_client
+    with httpx_lock:
+        if httpx_client is None:
+            import httpx
+            connect, read = split_timeout(timeout)
+            httpx_client = httpx.Client(http2=True,
+                                        timeout=httpx.Timeout(read, connect=connect),
+                                        limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize))
+        return httpx_client
+
+def retry_errors():
+    """Return the exception types that are retried."""
+    errors = (requests.ConnectionError, requests.Timeout)
+    if use_http2():
+        import httpx
+        errors += (httpx.TransportError,)
+    return errors
+
+def drop_none(value):
+    """Return query parameters / form fields without the None values, which requests leaves out but httpx sends empty."""
+    if isinstance(value, dict):
+        return {k: v for k, v in value.items() if v is not None}
+    return value
+
+def send(method, url, **kwargs):
+    if url.startswith('https://') and use_http2():
+        import httpx
+        connect, read = split_timeout(kwargs['timeout'])
+        kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+        for key in ['params', 'data']:
+            if key in kwargs:
+                kwargs[key] = drop_none(kwargs[key])
+        return get_httpx_client().request(method, url, **kwargs)
+    return get_session().request(method, url, **kwargs)
+
+def wait(attempt):
+    time.sleep(backoff_factor * 2 ** attempt + random.uniform(0, backoff_factor))
+
+def send_with_retries(method, url, **kwargs):
+    """Send a request, connection errors, timeouts and `retry_statuses` responses are retried with backoff."""
+    errors = retry_errors()
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            response = send(method, url, **kwargs)
+        except errors as e:
+            metrics.record_request(method, url, type(e).__name__, time.perf_counter() - start, retry=attempt > 0)
+            if attempt == max_retries:
+                raise
+            logger.warning('%s from %s, retry %d', type(e).__name__, url, attempt + 1)
+            wait(attempt)
+            continue
+        metrics.record_request(method, url, response.status_code, time.perf_counter() - start,
+                               len(response.content), retry=attempt > 0)
+        if response.status_code in retry_statuses and attempt < max_retries:
+            logger.warning('%s from %s, retry %d', response.status_code, url, attempt + 1)
+            wait(attempt)
+            continue
+        return response
+
+def cache_entry(method, url, cache_ttl, cache_account=None, params=None, data=None, json=None, **kwargs):
+    """Return the cache key and the stored response of a request, (None, None) if the request is not cached."""
+    if cache_ttl <= 0 or not response_cache.enabled:
+        return None, None
+    cache_key = response_cache.key(method, url, params, data if data is not None else json, cache_account)
+    return cache_key, response_cache.get(cache_key)
+
+def cached_response(entry, url, cache_key):
+    """Return a stored response as a `requests.Response`, with ``from_cache`` set."""
+    from requests.utils import get_encoding_from_headers
+    from requests.structures import CaseInsensitiveDict
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response._content = entry['content']
+    response.encoding = get_encoding_from_headers(response.headers) or 'utf-8'
+    response.url = url
+    response.from_cache = True
+    response.cache_key = cache_key
+    return response
+
+def cached(method, url, cache_ttl=0, **kwargs):
+    """
+        Return the stored response of a request if it is still fresh, otherwise None.
+        For callers which wait for a rate limit before a request, so a cached page does not wait.
+    """
+    cache_key, entry = cache_entry(method, url, cache_ttl, **kwargs)
+    if entry is not None and entry['fresh']:
+        metrics.count('cache_hits')
+        return cached_response(entry, url, cache_key)
+    return None
+
+def request(method, url, cache_ttl=0, cache_account=None, **kwargs):
+    """
+        Send a request through the pooled client, with the default timeout and retries.
+        Accepts the keyword arguments of `requests.request` (params, data, json, headers, timeout),
+        and returns a response with `status_code`, `headers`, `text`, `content` and `json()`.
+        - ``cache_ttl``: seconds a 200 response is served from `response_cache` (0 = not cached), also for a POST which only reads.
+        - ``cache_account``: added to the cache key, for credentials which are not in the URL.
+        The response has ``cache_key`` when it is cached, and ``from_cache`` when it was not downloaded.
+    """
+    kwargs.setdefault('timeout', timeout)
+    cache_key, entry = cache_entry(method, url, cache_ttl, cache_account, **kwargs)
+    if entry is not None:
+        if entry['fresh']:
+            metrics.count('cache_hits')
+            return cached_response(entry, url, cache_key)
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), **response_cache.conditional_headers(entry)}
+    response = send_with_retries(method, url, **kwargs)
+    if cache_key is None:
+        return response
+    if response.status_code == 304 and entry is not None:
+        metrics.count('cache_revalidated')
+        response_cache.refresh(cache_key, cache_ttl)
+        return cached_response(entry, url, cache_key)
+    metrics.count('cache_misses')
+    if response.status_code == 200:
+        response_cache.put(cache_key, url, response.status_code, response.headers, response.content, cache_ttl)
+    response.cache_key = cache_key
+    return response
+
+def build_http(cache_ttls=None, cache_account=None):
+    """
+        Return an `httplib2.Http` for googleapiclient, with the read timeout of this client, which records its calls in `metrics`.
+        ``cache_ttls``: {regular expression of the URL path: seconds}, the GET requests of a matching endpoint are served
+        from `response_cache` like ``cache_ttl`` of `request()`, ``cache_account`` is added to their cache keys.
+    """
+    import httplib2
+    
+    def cache_ttl_of(uri, method):
+        path = urlparse(uri).path
+        return next((ttl for pattern, ttl in (cache_ttls or {}).items() if method == 'GET' and re.search(pattern, path)), 0)
+    
+    def stored(entry):
+        return httplib2.Response({'status': str(entry['status']), **{k.lower(): v for k, v in entry['headers'].items()}}), entry['content']
+    
+    class Http(httplib2.Http):
+        def timed_request(self, uri, method, body, headers, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                response, content = super().request(uri, method, body, headers, *args, **kwargs)
+            except Exception as e:
+                metrics.record_request(method, uri, type(e).__name__, time.perf_counter() - start)
+                raise
+            metrics.record_request(method, uri, response.status, time.perf_counter() - start, len(content or b''))
+            return response, content
+        
+        def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+            cache_ttl = cache_ttl_of(uri, method)
+            cache_key, entry = cache_entry(method, uri, cache_ttl, cache_account, data=body)
+            if entry is not None:
+                if entry['fresh']:
+                    metrics.count('cache_hits')
+                    return stored(entry)
+                headers = {**(headers or {}), **{k.lower(): v for k, v in response_cache.conditional_headers(entry).items()}}
+            response, content = self.timed_request(uri, method, body, headers, *args, **kwargs)
+            if cache_key is None:
+                return response, content
+            if response.status == 304 and entry is not None:
+                metrics.count('cache_revalidated')
+                response_cache.refresh(cache_key, cache_ttl)
+                return stored(entry)
+            metrics.count('cache_misses')
+            if response.status == 200:
+                response_cache.put(cache_key, uri, response.status, response, content, cache_ttl)
+            return response, content
+    
+    return Http(timeout=split_timeout(timeout)[1])
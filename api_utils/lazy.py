@@ -0,0 +1,32 @@
+"""
+Lazy imports for the heavy libraries of the scripts in this repository (pandas, numpy), so a short run, ``--help``
+or a test which only imports a script does not pay for them.
+
+`lazy_import()` returns a stand-in at once, the module is imported on the first attribute access (``pd.DataFrame``),
+also from several threads at the same time (the import lock of Python makes them wait for the same import).
+
+Usage:
+    from api_utils.lazy import lazy_import
+    pd = lazy_import('pandas')
+"""
+
+
+import importlib
+
+class LazyModule:
+    """Stand-in for a module, imports it on the first attribute access and then keeps its attributes."""
+    def __init__(self, name):
+        self.__dict__['__name__'] = name
+
+    def __getattr__(self, attr):
+        # only called for an attribute not copied yet, e.g. before the import
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name__!r}>'
+
+def lazy_import(name):
+    """Return a stand-in for the module ``name``, which is imported on the first attribute access."""
+    return LazyModule(name)
@@ -0,0 +1,159 @@
+"""
+Run metrics shared by the scripts in this repository, to find the hot spots of a run in production.
+
+- Requests: every HTTP call of `http_client` (also the googleapiclient calls through `http_client.build_http()`) is recorded
+  with its endpoint, status code, latency, response bytes and whether it was a retry. The ids in the URL path are replaced
+  by ``{id}``, so e.g. the reviews of all locations are one endpoint.
+- Stages: `stage()` times a stage of a script (fetch, parse, transform, write), optionally for a key such as a location,
+  so the slowest locations / pages / files can be listed.
+- Counters: `count()` counts an event, responses with a `quota_statuses` status are counted as ``quota_hits``.
+- `summary()`: p50 / p95 / max latency per endpoint and stage, the `slowest_count` slowest keys of each stage and the counters.
+- `export()`: saves the summary as JSON, or as Prometheus text format for a file name ending with '.prom'.
+
+Usage:
+    from api_utils import metrics
+    with metrics.stage('write', key=shopid):
+        ...
+    metrics.export('run_metrics.json')
+"""
+
+
+import re
+import json
+import math
+import time
+import threading
+import contextlib
+from urllib.parse import urlparse
+
+# Set up the metrics
+slowest_count = 10         # slowest keys listed per stage
+quota_statuses = (429,)    # responses counted as quota hits
+
+lock = threading.Lock()
+request_metrics = {}  # endpoint -> {'latency': [...], 'status': {...}, 'bytes': n, 'retries': n}
+stage_metrics = {}    # stage -> {'seconds': [...], 'keys': {key: seconds}}
+counters = {}  # name -> n
+
+def reset():
+    """Clear all metrics, e.g. between two runs in the same process."""
+    with lock:
+        request_metrics.clear()
+        stage_metrics.clear()
+        counters.clear()
+
+def endpoint(method, url):
+    """Return the endpoint of a URL, the path segments with digits (ids) are replaced by {id}, except the API version."""
+    u = urlparse(url)
+    segments = [s if not re.search(r'\d', s) or re.fullmatch(r'v\d+(\.\d+)?', s) else '{id}' for s in u.path.split('/')]
+    return f'{method} {u.netloc}{"/".join(segments)}'
+
+def record_request(method, url, status, seconds, size=0, retry=False):
+    """Record one HTTP call, ``status`` is the status code or the name of the exception of a failed call."""
+    key = endpoint(method, url)
+    with lock:
+        item = request_metrics.setdefault(key, {'latency': [], 'status': {}, 'bytes': 0, 'retries': 0})
+        item['latency'].append(seconds)
+        item['status'][str(status)] = item['status'].get(str(status), 0) + 1
+        item['bytes'] += size
+        item['retries'] += int(retry)
+        if status in quota_statuses:
+            counters['quota_hits'] = counters.get('quota_hits', 0) + 1
+
+def record_stage(name, seconds, key=None):
+    with lock:
+        item = stage_metrics.setdefault(name, {'seconds': [], 'keys': {}})
+        item['seconds'].append(seconds)
+        if key is not None:
+            item['keys'][key] = item['keys'].get(key, 0) + seconds
+
+@contextlib.contextmanager
+def stage(name, key=None):
+    """Time the code of the with block as the stage ``name``, the time of the same ``key`` is added up."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, key)
+
+def count(name, n=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+def percentile(values, q):
+    """Return the q-th percentile (nearest rank) of the values."""
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)), 1) - 1]
+
+def summary():
+    """Return the summary of all metrics as a dict."""
+    with lock:
+        rst = {'requests': {}, 'stages': {}, 'counters': dict(counters)}
+        for key, item in request_metrics.items():
+            latency = item['latency']
+            rst['requests'][key] = {
+                'count': len(latency),
+                'seconds': round(sum(latency), 6),
+                'p50': percentile(latency, 50),
+                'p95': percentile(latency, 95),
+                'max': max(latency),
+                'bytes': item['bytes'],
+                'retries': item['retries'],
+                'status': dict(item['status'])
+                }
+        for name, item in stage_metrics.items():
+            seconds = item['seconds']
+            slowest = sorted(item['keys'].items(), key=lambda x: x[1], reverse=True)[:slowest_count]
+            rst['stages'][name] = {
+                'count': len(seconds),
+                'seconds': round(sum(seconds), 6),
+                'p50': percentile(seconds, 50),
+                'p95': percentile(seconds, 95),
+                'max': max(seconds),
+                'slowest': [{'key': str(key), 'seconds': round(value, 6)} for key, value in slowest]
+                }
+        return rst
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def prometheus(rst=None):
+    """Return the summary in Prometheus text format."""
+    rst = summary() if rst is None else rst
+    lines = ['# TYPE api_request_seconds summary']
+    for key, item in rst['requests'].items():
+        for q in ['p50', 'p95']:
+            lines.append(f'api_request_seconds{{endpoint="{label(key)}",quantile="0.{q[1:]}"}} {item[q]}')
+        lines.append(f'api_request_seconds_sum{{endpoint="{label(key)}"}} {item["seconds"]}')
+        lines.append(f'api_request_seconds_count{{endpoint="{label(key)}"}} {item["count"]}')
+    lines.append('# TYPE api_responses_total counter')
+    for key, item in rst['requests'].items():
+        for status, n in item['status'].items():
+            lines.append(f'api_responses_total{{endpoint="{label(key)}",status="{label(status)}"}} {n}')
+    lines.append('# TYPE api_response_bytes_total counter')
+    lines.extend(f'api_response_bytes_total{{endpoint="{label(key)}"}} {item["bytes"]}' for key, item in rst['requests'].items())
+    lines.append('# TYPE api_retries_total counter')
+    lines.extend(f'api_retries_total{{endpoint="{label(key)}"}} {item["retries"]}' for key, item in rst['requests'].items())
+    lines.append('# TYPE stage_seconds summary')
+    for name, item in rst['stages'].items():
+        for q in ['p50', 'p95']:
+            lines.append(f'stage_seconds{{stage="{label(name)}",quantile="0.{q[1:]}"}} {item[q]}')
+        lines.append(f'stage_seconds_sum{{stage="{label(name)}"}} {item["seconds"]}')
+        lines.append(f'stage_seconds_count{{stage="{label(name)}"}} {item["count"]}')
+    for name, n in rst['counters'].items():
+        metric = re.sub(r'\W', '_', name)
+        lines.append(f'# TYPE {metric}_total counter')
+        lines.append(f'{metric}_total {n}')
+    return '\n'.join(lines) + '\n'
+
+def export(fn):
+    """Save the summary to ``fn``, in Prometheus text format if the file name ends with '.prom', otherwise as JSON."""
+    rst = summary()
+    with open(fn, 'w', encoding='utf-8') as f:
+        if fn.endswith('.prom'):
+            f.write(prometheus(rst))
+        else:
+            json.dump(rst, f, ensure_ascii=False, indent=2)
+    return rst
@@ -0,0 +1,110 @@
+"""
+Fetch -> transform -> sink pipeline of the collectors, so parsing and writing overlap with the network I/O
+instead of every step waiting for the one before it.
+
+- fetch: called for every item in `fetch_workers` threads, e.g. the API pages of a batch of locations.
+- transform: called for every fetched result in one thread, e.g. building the DataFrame.
+- sink: called for every transformed result in the calling thread, in the order they are done, e.g. writing the output.
+The stages are connected by queues of ``queue_size`` results, a slow sink makes the fetch wait instead of keeping
+every fetched page in memory. The first exception of any stage stops the pipeline and is raised by `run()`.
+
+Usage:
+    from api_utils import pipeline
+    pipeline.run(batches, fetch=fetch_batch, transform=to_frames, sink=writer.write, fetch_workers=4)
+"""
+
+
+import queue
+import threading
+
+done = object() # marks the end of a queue
+
+def put(q, value, stop):
+    """Put a value, waiting while the queue is full, returns False if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            q.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def get(q, stop):
+    """Return the next value, or `done` if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return done
+
+def run(items, fetch, transform=None, sink=None, fetch_workers=1, queue_size=4):
+    """
+        Run ``fetch(item)``, ``transform(item, fetched)`` and ``sink(item, transformed)`` for every item,
+        returns the number of items which reached the sink. Without ``transform`` the fetched result goes to the sink as it is.
+    """
+    items = iter(items)
+    lock = threading.Lock()
+    fetched = queue.Queue(queue_size)
+    transformed = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+    running = [fetch_workers]
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def fetch_worker():
+        try:
+            while not stop.is_set():
+                with lock:
+                    item = next(items, done)
+                if item is done or not put(fetched, (item, fetch(item)), stop):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            with lock:
+                running[0] -= 1
+                last = running[0] == 0
+            if last:
+                put(fetched, done, stop)
+
+    def transform_worker():
+        try:
+            while True:
+                value = get(fetched, stop)
+                if value is done:
+                    break
+                item, result = value
+                if not put(transformed, (item, result if transform is None else transform(item, result)), stop):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            put(transformed, done, stop)
+
+    threads = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(fetch_workers)]
+    threads.append(threading.Thread(target=transform_worker, daemon=True))
+    for thread in threads:
+        thread.start()
+    count = 0
+    try:
+        while True:
+            value = get(transformed, stop)
+            if value is done:
+                break
+            item, result = value
+            if sink is not None:
+                sink(item, result)
+            count += 1
+    except BaseException as e:
+        fail(e)
+    finally:
+        stop.set() # also releases the threads still waiting on a queue
+        for thread in threads:
+            thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return count
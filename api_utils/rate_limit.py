@@ -0,0 +1,56 @@
+"""
+Request rate budget of an API, shared by the threads of a script (and set per API by `run_collectors`).
+
+Usage:
+    from api_utils.rate_limit import RateLimiter
+    rate_limiter = RateLimiter(qps=5, burst=10)
+    rate_limiter.acquire() # before every request
+    rate_limiter.acquire(len(calls)) # before a batch request, which counts as one call per request in it
+"""
+
+
+import time
+import random
+import threading
+
+class RateLimiter:
+    """
+        A token bucket shared by every API call of a script, so the requests stay right at the quota of the API.
+        
+        - `acquire()`: Waits until ``n`` tokens are available (one per API call). Tokens refill at `qps` per second, up to `burst` tokens.
+          More than `burst` tokens are taken once `burst` tokens are available, then the caller waits until the rest has refilled.
+        - `backoff()`: Pauses all callers after a 429 / 503 response, for the Retry-After time (or an exponential delay) plus a random jitter.
+    """
+    def __init__(self, qps, burst):
+        self.qps = qps
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self, n=1):
+        need = min(n, self.burst)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= need:
+                    self.tokens -= n
+                    # the tokens taken beyond the bucket are waited for here, the callers after it wait until they refilled
+                    refill = max(-self.tokens, 0) / self.qps
+                    break
+                wait = max(self.paused_until - now, (need - self.tokens) / self.qps)
+            time.sleep(wait)
+        if refill > 0:
+            time.sleep(refill)
+    
+    def backoff(self, retry_after, attempt):
+        if retry_after is None:
+            retry_after = min(2 ** attempt, 60)
+        delay = retry_after + random.uniform(0, 1)
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.tokens = 0
+        return delay
@@ -0,0 +1,151 @@
+"""
+Persistent cache of API responses shared by the scripts in this repository, so a re-run (e.g. while developing or after
+a partial failure) serves the pages it already fetched from disk instead of spending API quota again.
+
+- Storage: one SQLite file (`cache_file`), safe to use from several threads and processes.
+- Keys: method, URL, query parameters, request body and an optional account, the credential parameters in
+  `ignored_params` (e.g. a Graph API access token, which changes between runs) are left out.
+- TTL: every response is stored with the TTL of its endpoint, given by the caller (`http_client.request(cache_ttl=...)`
+  or `http_client.build_http(cache_ttls=...)`), a fresh response is served without a request.
+- Revalidation: an expired response with an ETag or Last-Modified header is asked again with If-None-Match /
+  If-Modified-Since, a 304 answer makes the stored response fresh again without downloading it.
+- Size: when the stored responses exceed `max_bytes`, the least recently used are removed.
+- Only 200 responses are stored, and only the headers in `stored_headers` (e.g. not the rate-limit usage headers).
+
+Usage:
+    from api_utils import http_client, response_cache
+    response = http_client.request('GET', url, params=params, cache_ttl=86400)
+    response_cache.configure(enabled=False) # always fetch
+"""
+
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qsl
+
+# Set up the cache
+enabled = True
+cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'api_responses.sqlite')
+max_bytes = 500 * 1024 ** 2     # stored response bodies, the least recently used are removed above this size
+ignored_params = {'access_token', 'appsecret_proof'} # credentials, not part of the key
+stored_headers = ('Content-Type', 'ETag', 'Last-Modified')
+
+local = threading.local()
+
+def configure(**settings):
+    """Change the cache settings above, the database is opened again with the new settings."""
+    for key, value in settings.items():
+        if key not in {'enabled', 'cache_file', 'max_bytes', 'ignored_params', 'stored_headers'}:
+            raise ValueError(f'unknown response_cache setting: {key}')
+        globals()[key] = value
+    local.__dict__.clear()
+
+def get_db():
+    """Return the SQLite connection of the current thread, the table is created on the first use."""
+    db = getattr(local, 'db', None)
+    if db is None or local.cache_file != cache_file:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        db = sqlite3.connect(cache_file, timeout=30, isolation_level=None) # autocommit, every statement is its own transaction
+        db.execute('PRAGMA journal_mode=WAL') # readers do not wait for a writer
+        db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                          key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, content BLOB,
+                          etag TEXT, last_modified TEXT, stored_at REAL, expires_at REAL, last_used REAL, size INTEGER)''')
+        db.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        local.db = db
+        local.cache_file = cache_file
+    return db
+
+def normalize(value):
+    """Return a request body or parameters as text, dict items sorted and without the `ignored_params`."""
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        value = {k: v for k, v in value.items() if k not in ignored_params and v is not None}
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+def key(method, url, params=None, body=None, account=None):
+    """Return the cache key of a request, the query of the URL and ``params`` are merged and sorted."""
+    u = urlparse(url)
+    query = {k: v for k, v in parse_qsl(u.query, keep_blank_values=True)}
+    query.update(params or {})
+    text = '\n'.join([method.upper(), f'{u.scheme}://{u.netloc}{u.path}', normalize(query), normalize(body), str(account or '')])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def get(cache_key):
+    """
+        Return the stored response of a key as a dict (status, headers, content, etag, last_modified, fresh), or None.
+        ``fresh`` is False when the TTL has expired, the response can then be revalidated with `conditional_headers()`.
+    """
+    if not enabled:
+        return None
+    db = get_db()
+    row = db.execute('SELECT status, headers, content, etag, last_modified, expires_at FROM responses WHERE key = ?',
+                     (cache_key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    db.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, cache_key))
+    status, headers, content, etag, last_modified, expires_at = row
+    return {'status': status, 'headers': json.loads(headers), 'content': content,
+            'etag': etag, 'last_modified': last_modified, 'fresh': expires_at > now}
+
+def conditional_headers(entry):
+    """Return the If-None-Match / If-Modified-Since headers to revalidate an expired response."""
+    headers = {}
+    if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def put(cache_key, url, status, headers, content, ttl):
+    """Store a response for ``ttl`` seconds, then remove the least recently used responses above `max_bytes`."""
+    if not enabled or ttl <= 0:
+        return
+    headers = {name.lower(): value for name, value in headers.items()} # requests, httpx and httplib2 headers
+    headers = {name: headers[name.lower()] for name in stored_headers if headers.get(name.lower()) is not None}
+    now = time.time()
+    db = get_db()
+    db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+               (cache_key, url, status, json.dumps(headers), content, headers.get('ETag'), headers.get('Last-Modified'),
+                now, now + ttl, now, len(content)))
+    evict(db)
+
+def refresh(cache_key, ttl):
+    """Make a stored response fresh for another ``ttl`` seconds, after the API answered 304 Not Modified."""
+    if not enabled:
+        return
+    now = time.time()
+    get_db().execute('UPDATE responses SET expires_at = ?, last_used = ? WHERE key = ?', (now + ttl, now, cache_key))
+
+def delete(cache_key):
+    """Remove a stored response, e.g. a batch response which contained failed calls."""
+    if enabled:
+        get_db().execute('DELETE FROM responses WHERE key = ?', (cache_key,))
+
+def evict(db=None):
+    """
+        Remove the expired responses which cannot be revalidated, then the least recently used responses
+        until the stored bodies fit in `max_bytes`. Returns the number of removed responses.
+    """
+    db = get_db() if db is None else db
+    removed = db.execute('DELETE FROM responses WHERE expires_at <= ? AND etag IS NULL AND last_modified IS NULL',
+                         (time.time(),)).rowcount
+    if db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0] > max_bytes:
+        # keep the most recently used responses whose running total of sizes is within max_bytes
+        removed += db.execute('''DELETE FROM responses WHERE key IN (
+                                     SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept FROM responses)
+                                     WHERE kept > ?)''', (max_bytes,)).rowcount
+    return removed
+
+def clear():
+    """Remove every stored response."""
+    get_db().execute('DELETE FROM responses')
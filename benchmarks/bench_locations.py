@@ -0,0 +1,82 @@
+"""
+Benchmark for transforming the location list of `googlemaps_reviews.Locations`.
+
+Synthetic API pages (100 locations per page, the same as the API) with 1 to 3 address lines
+and some missing fields are transformed by:
+- current : `Locations.trans_location_records()`, the records are flattened in one pass and the DataFrame is built once.
+- previous: a DataFrame per page, `apply(pd.Series)` to expand the address dicts and row-wise `apply(' '.join)`.
+
+Both outputs must be identical (after resetting the index of the previous output, which `loop_account()` also does).
+
+Usage:
+    python benchmarks/bench_locations.py [number of locations]
+"""
+
+
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrape_googlemaps_reviews'))
+from googlemaps_reviews import Locations
+
+page_size = 100
+account = 'accounts/1'
+
+def make_pages(n):
+    """Return `n` synthetic locations split into API pages."""
+    locations = []
+    for i in range(n):
+        address = {
+            'regionCode': 'TW',
+            'languageCode': 'zh-TW',
+            'postalCode': f'{100 + i % 900}',
+            'administrativeArea': '台北市',
+            'locality': f'區{i % 12}',
+            'addressLines': [f'路{i % 50}號'] + [f'{j}樓' for j in range(i % 3)]
+            }
+        if i % 17 == 0:
+            del address['postalCode']
+        location = {'name': f'locations/{i}', 'title': f'store {i}', 'storeCode': f'S{i:05d}', 'storefrontAddress': address}
+        if i % 29 == 0:
+            del location['storeCode']
+        locations.append(location)
+    return [locations[i:i + page_size] for i in range(0, n, page_size)]
+
+def run_current(pages):
+    records = []
+    for page in pages:
+        records.extend(page)
+    return Locations(account).trans_location_records(records)
+
+def run_previous(pages):
+    df = pd.concat([pd.DataFrame.from_dict(page) for page in pages])
+    df = pd.concat([df, df['storefrontAddress'].apply(pd.Series)], axis=1)
+    df = pd.concat([df, pd.DataFrame(df['addressLines'].apply(pd.Series)).rename(columns=lambda x: "storeaddress"+str(x))], axis=1)
+    df = df.fillna("")
+    sel_col = [col for col in df.columns if 'storeaddress' in col]
+    df['addressLine'] = df[sel_col].apply(lambda x: ' '.join(x), axis=1)
+    df['address'] = df[['administrativeArea', 'locality', 'addressLine']].apply(lambda x: ''.join(x), axis=1)
+    df['account'] = account
+    return df[["account", "name", "storeCode", "title", "postalCode", "address"]]
+
+def timeit(func, pages):
+    start = time.perf_counter()
+    df = func(pages)
+    return time.perf_counter() - start, df
+
+def main(n=20000):
+    pages = make_pages(n)
+    current_seconds, current_df = timeit(run_current, pages)
+    previous_seconds, previous_df = timeit(run_previous, pages)
+    print(f'{n} locations')
+    print(f'current : {current_seconds:.3f}s')
+    print(f'previous: {previous_seconds:.3f}s')
+    print(f'speedup : {previous_seconds / current_seconds:.1f}x')
+    
+    pd.testing.assert_frame_equal(current_df, previous_df.reset_index(drop=True))
+    print('current and previous output are identical')
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,157 @@
+"""
+Offline benchmark of the API pipelines of all three scripts against the local stand-in server of `mock_server.py`,
+so a performance change can be measured without credentials or network access.
+
+The API URLs of each script are pointed at the server (the access tokens are fake), then each pipeline is run:
+- locations     : `googlemaps_reviews.loop_account()`, the locations of every account.
+- reviews       : `googlemaps_reviews.loop_shops_reviews()`, the reviews of every location with `max_workers` threads.
+- reviews_batch : `googlemaps_reviews.loop_shops_reviews2()`, the reviews with batchGetReviews, `max_workers` batches fetched at a time.
+- insights      : `fanpage_impressions_monthly.collect_pages()`, the monthly insights of every fan page with batch requests.
+- permissions   : `Google_Sheets_permissions.loop_fileinfo()`, the permissions of every Google Sheet with batch requests.
+
+For each pipeline the wall time, HTTP requests per second, API calls (a batch request counts each of its calls),
+throttled calls and the peak memory (tracemalloc, measured in a second run because tracing slows the code down) are reported.
+The outputs are written to a temporary directory.
+
+The response cache (`api_utils.response_cache`) is disabled, with ``--cache`` it uses a temporary file and each pipeline
+is run once before it is measured, so the measured run is a re-run served from the cache.
+
+Usage:
+    python benchmarks/bench_pipelines.py [--latency 0.02] [--throttle-every 0] [--page-size 100] [--cache] [pipeline ...]
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import requests
+from datetime import date
+
+from mock_server import start_process
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrape_googlemaps_reviews'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'facebook_fanpage_data'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get_googlesheets_permissions'))
+import googlemaps_reviews as gmb
+import fanpage_impressions_monthly as fb
+import Google_Sheets_permissions as drive
+from api_utils import http_client, response_cache
+
+pipelines = ['locations', 'reviews', 'reviews_batch', 'insights', 'permissions']
+
+def point_to(url, work_dir, args):
+    """Point the API URLs of every script to the server at ``url`` and the outputs to ``work_dir``."""
+    response_cache.configure(enabled=args.cache, cache_file=os.path.join(work_dir, 'responses.sqlite'))
+    
+    # Google My Business
+    gmb.refresh_token_url = f'{url}/token'
+    gmb.locations_api = f'{url}/v1/account/locations'
+    gmb.reviews_api = f'{url}/v4/account/location/reviews'
+    gmb.locations_api_bat = f'{url}/v4/account/locations:batchGetReviews'
+    gmb.token_provider.access_token = 'mock-token'
+    gmb.token_provider.expires_at = time.time() + 86400
+    gmb.rate_limiter = gmb.RateLimiter(args.qps, args.qps)
+    gmb.save_dir = work_dir
+    gmb.account_details = os.path.join(work_dir, 'account.json')
+    with open(gmb.account_details, 'w') as f:
+        json.dump({'accounts': [{'name': f'accounts/{i}'} for i in range(args.accounts)]}, f)
+
+    # Facebook Graph
+    fb.graph_url = f'{url}/'
+    fb.store_dir = os.path.join(work_dir, 'insights')
+    fb.get_token = lambda path=None: 'mock-token'
+    fb.throttle_pause = 0.1 # the server throttles every n-th call, not a time window
+
+    # Google Drive, the discovery document shipped with googleapiclient with the root URL of the server
+    from googleapiclient import discovery
+    from googleapiclient.discovery_cache import get_static_doc
+    document = json.loads(get_static_doc('drive', 'v3'))
+    document['rootUrl'] = f'{url}/'
+    http = http_client.build_http(cache_ttls={drive.permissions_endpoint: drive.permissions_cache_ttl}, cache_account=drive.CLIENT_SECRET_FILE)
+    drive.drive_service = discovery.build_from_document(document, http=http)
+    drive.save_dir = work_dir
+
+def run_pipeline(name, args):
+    os.chdir(gmb.save_dir)
+    if name == 'locations':
+        gmb.loop_account(max_workers=gmb.max_workers)
+    elif name == 'reviews':
+        if os.path.exists(gmb.checkpoint_filename):
+            os.remove(gmb.checkpoint_filename)
+        gmb.loop_shops_reviews(max_workers=gmb.max_workers, fmt='csv')
+    elif name == 'reviews_batch':
+        gmb.loop_shops_reviews2(fmt='csv', max_workers=gmb.max_workers)
+    elif name == 'insights':
+        pages = [{'id': f'page{i}'} for i in range(args.fan_pages)]
+        dates = [date(2020 + month // 12, month % 12 + 1, 1) for month in range(args.months)]
+        fb.collect_pages(pages, dates)
+    elif name == 'permissions':
+        fileinfo = [{'file': f'sheet{i}', 'id': f'file{i}', 'filename': f'sheet{i}'} for i in range(args.files)]
+        drive.loop_fileinfo(fileinfo, output='csv')
+
+def measure(name, url, args):
+    """Return the wall time, the server counters and the peak memory of a pipeline."""
+    if args.cache:
+        run_pipeline(name, args)
+    requests.post(f'{url}/_reset')
+    start = time.perf_counter()
+    run_pipeline(name, args)
+    seconds = time.perf_counter() - start
+    stats = requests.get(f'{url}/_stats').json()
+
+    tracemalloc.start()
+    run_pipeline(name, args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'pipeline': name, 'seconds': seconds, 'requests/s': stats['requests'] / seconds, **stats, 'peak MB': peak / 1e6}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API pipelines against a local stand-in server.')
+    parser.add_argument('pipelines', nargs='*', metavar='pipeline',
+                        help=f'pipelines to run, all by default: {", ".join(pipelines)}')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every HTTP request')
+    parser.add_argument('--page-size', type=int, default=100, help='largest page returned by the server')
+    parser.add_argument('--throttle-every', type=int, default=0, help='answer every n-th API call with a rate-limit error')
+    parser.add_argument('--accounts', type=int, default=2, help='Google My Business accounts')
+    parser.add_argument('--locations', type=int, default=100, help='locations per account')
+    parser.add_argument('--reviews', type=int, default=120, help='reviews per location')
+    parser.add_argument('--qps', type=float, default=1000, help='rate limit of the Google My Business script')
+    parser.add_argument('--fan-pages', type=int, default=20, help='Facebook fan pages')
+    parser.add_argument('--months', type=int, default=24, help='months of insights per fan page')
+    parser.add_argument('--files', type=int, default=500, help='Google Sheets')
+    parser.add_argument('--permissions', type=int, default=30, help='permissions per Google Sheet')
+    parser.add_argument('--cache', action='store_true', help='measure a re-run served from the response cache')
+    args = parser.parse_args()
+    unknown = set(args.pipelines) - set(pipelines)
+    if len(unknown) > 0:
+        parser.error(f'unknown pipelines: {", ".join(sorted(unknown))}')
+
+    process, url = start_process(latency=args.latency, page_size=args.page_size, throttle_every=args.throttle_every,
+                                 locations=args.locations, reviews=args.reviews, permissions=args.permissions)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        point_to(url, work_dir, args)
+        names = args.pipelines or pipelines
+        if any(name in {'reviews', 'reviews_batch'} for name in names) and 'locations' not in names:
+            # the reviews pipelines read the location list written by loop_account()
+            names = ['locations'] + names
+        for name in names:
+            print(f'run {name}')
+            results.append(measure(name, url, args))
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    process.terminate()
+
+    print()
+    print(f'latency {args.latency}s, page size {args.page_size}, throttle every {args.throttle_every or "-"}, cache {"on" if args.cache else "off"}')
+    print(f'{"pipeline":<14}{"seconds":>9}{"requests":>10}{"requests/s":>12}{"calls":>8}{"throttled":>11}{"peak MB":>9}')
+    for r in results:
+        print(f'{r["pipeline"]:<14}{r["seconds"]:>9.2f}{r["requests"]:>10}{r["requests/s"]:>12.1f}'
+              f'{r["calls"]:>8}{r["throttled"]:>11}{r["peak MB"]:>9.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for building the review detail DataFrame of `googlemaps_reviews.Reviews`.
+
+Synthetic review pages (50 reviews per page, the same as the API) are fed into the page loop of one location.
+- current : `Reviews.get_reviews_detailall()` collects the reviews into `ReviewColumns` and `reviews_detail_df()` builds the DataFrame once.
+- previous: one single-row DataFrame per review, re-concatenated and regex-replaced on every page.
+
+The time per review of the current path should stay flat when the number of reviews grows (linear scaling),
+while the previous path grows with the number of reviews (quadratic scaling).
+
+Usage:
+    python benchmarks/bench_reviews_detail.py
+"""
+
+
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrape_googlemaps_reviews'))
+from googlemaps_reviews import Reviews
+
+page_size = 50
+current_sizes = [1000, 2000, 4000, 8000, 16000]
+previous_sizes = [1000, 2000, 4000]
+star_ratings = ['ONE', 'TWO', 'THREE', 'FOUR', 'FIVE']
+
+def make_pages(n):
+    """Return `n` synthetic reviews split into API pages."""
+    reviews = [{
+        'reviewId': f'review{i}',
+        'reviewer': {'displayName': f'user{i}'},
+        'starRating': star_ratings[i % 5],
+        'comment': f'comment {i}\nsecond line',
+        'createTime': '2024-01-01T00:00:00Z',
+        'updateTime': '2024-01-02T00:00:00Z',
+        'name': f'accounts/1/locations/1/reviews/review{i}',
+        } for i in range(n)]
+    return [{'reviews': reviews[i:i + page_size]} for i in range(0, n, page_size)]
+
+def run_current(pages):
+    rev_obj = Reviews({'account': 'accounts/1', 'name': 'locations/1', 'storeCode': 'S001'})
+    for page in pages:
+        rev_obj.get_reviews_detailall(page)
+    return rev_obj.reviews_detail_df()
+
+def run_previous(pages):
+    review_detail = []
+    for page in pages:
+        for r_list in page.get('reviews', []):
+            sel_column = {x: r_list[x] for x in r_list if x not in {'reviewer', 'name', 'reviewReply'}}
+            review_detail.append(pd.DataFrame([sel_column]))
+        rst_df = pd.concat(review_detail, ignore_index=1)
+        rst_df = rst_df.replace(r'\n', ' ', regex=True)
+        rst_df['storeCode'] = 'S001'
+    return rst_df
+
+def timeit(func, pages):
+    start = time.perf_counter()
+    df = func(pages)
+    return time.perf_counter() - start, df
+
+def main():
+    print(f'{"path":<10}{"reviews":>10}{"seconds":>12}{"us/review":>12}')
+    for name, func, sizes in [('current', run_current, current_sizes), ('previous', run_previous, previous_sizes)]:
+        for n in sizes:
+            seconds, df = timeit(func, make_pages(n))
+            assert len(df) == n
+            print(f'{name:<10}{n:>10}{seconds:>12.3f}{seconds / n * 10**6:>12.1f}')
+
+    # both paths must produce the same DataFrame, the dictionary-encoded columns of the current path are compared as text
+    pages = make_pages(500)
+    current_df = run_current(pages).astype({'starRating': str, 'storeCode': str})
+    pd.testing.assert_frame_equal(current_df, run_previous(pages))
+    print('current and previous output are identical')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Memory benchmark for holding the reviews of a large account, as `googlemaps_reviews.Reviews_bat` does until a batch is written.
+
+Synthetic batchGetReviews pages (50 reviews per page, the same as the API) of 400 stores are parsed from JSON text one page at a time
+(only the collected reviews are kept, the same as the page loop), then the review detail DataFrame is built:
+- current : `ReviewColumns`, one list per text column and dictionary-encoded star ratings and store codes.
+- previous: one dict per review and `pd.DataFrame.from_records()`.
+
+The peak traced memory (tracemalloc) is reported after collecting the reviews and after building the DataFrame.
+Both outputs must be identical (the dictionary-encoded columns of the current path are compared as text).
+
+Usage:
+    python benchmarks/bench_reviews_memory.py [number of reviews]
+"""
+
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrape_googlemaps_reviews'))
+from googlemaps_reviews import ReviewColumns
+
+page_size = 50
+stores = 400
+star_ratings = ['ONE', 'TWO', 'THREE', 'FOUR', 'FIVE']
+
+def make_page(start, n):
+    """Return the JSON text of a synthetic batchGetReviews page, reviews ``start`` to ``start + n``."""
+    reviews = []
+    for i in range(start, start + n):
+        review = {
+            'reviewId': f'AbFvOqn{i:012d}',
+            'reviewer': {'profilePhotoUrl': f'https://lh3.googleusercontent.com/a/{i}', 'displayName': f'user {i}'},
+            'starRating': star_ratings[i * 7 % 5],
+            'comment': f'店員服務很好，環境乾淨 {i}\n第二行評論 ' + 'x' * (i % 120),
+            'createTime': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T08:{i % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z',
+            'updateTime': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T09:{i % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z',
+            'name': f'accounts/1/locations/{i % stores}/reviews/AbFvOqn{i:012d}'
+            }
+        if i % 3 == 0:
+            review['reviewReply'] = {'comment': '感謝您的評論', 'updateTime': review['updateTime']}
+        reviews.append({'name': f'accounts/1/locations/{i % stores}', 'review': review})
+    return json.dumps({'locationReviews': reviews})
+
+def pages(n):
+    for start in range(0, n, page_size):
+        yield json.loads(make_page(start, min(page_size, n - start)))
+
+shopids = {f'accounts/1/locations/{i}': f'S{i:03d}' for i in range(stores)}
+
+def collect_current(n):
+    review_detail = ReviewColumns()
+    for page in pages(n):
+        for location_review in page.get('locationReviews', []):
+            review_detail.append(location_review.get('review', {}), shopids.get(location_review.get('name')))
+    return review_detail
+
+def collect_previous(n):
+    review_detail = []
+    for page in pages(n):
+        for location_review in page.get('locationReviews', []):
+            r_list = location_review.get('review', {})
+            record = {x: r_list[x].replace('\n', ' ') if isinstance(r_list[x], str) else r_list[x]
+                      for x in r_list if x not in {'reviewer', 'name', 'reviewReply'}}
+            if 'reviewReply' in r_list:
+                record['replyUpdateTime'] = r_list['reviewReply'].get('updateTime')
+            record['storeCode'] = shopids.get(location_review.get('name'))
+            review_detail.append(record)
+    return review_detail
+
+def measure(collect, build, n):
+    """Return the seconds, the peak memory (MB) after collecting and after building the DataFrame, and the DataFrame."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    review_detail = collect(n)
+    collected_peak = tracemalloc.get_traced_memory()[1]
+    df = build(review_detail)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, collected_peak / 1e6, peak / 1e6, df
+
+def main(n=200000):
+    print(f'{n} reviews of {stores} stores')
+    print(f'{"path":<10}{"seconds":>10}{"collected MB":>14}{"peak MB":>10}{"DataFrame MB":>14}')
+    results = {}
+    for name, collect, build in [('current', collect_current, lambda review_detail: review_detail.to_frame()),
+                                 ('previous', collect_previous, pd.DataFrame.from_records)]:
+        seconds, collected, peak, df = measure(collect, build, n)
+        results[name] = df
+        print(f'{name:<10}{seconds:>10.2f}{collected:>14.1f}{peak:>10.1f}{df.memory_usage(deep=True).sum() / 1e6:>14.1f}')
+
+    current_df = results['current'].astype({'starRating': str, 'storeCode': str})
+    pd.testing.assert_frame_equal(current_df, results['previous'])
+    print('current and previous output are identical')
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,100 @@
+"""
+Offline benchmark of `collectors_scheduler/run_collectors.py` against the local stand-in server of `mock_server.py`.
+
+The same jobs (Google My Business locations then reviews, Facebook insights, Google Drive permissions) are run
+one after the other (``max_jobs`` 1) and as concurrent jobs. The concurrent run should take about as long as the
+slowest chain of jobs (a job and the jobs it runs after) instead of the sum of all jobs.
+
+The scripts are pointed at the server by `bench_pipelines.point_to()` before the jobs start, the job processes are
+forked so they inherit it (not available on Windows). pandas is imported before the fork for the same reason, so the
+import of every job is not measured. Only the waiting for the APIs overlaps on a machine with one core, the parsing
+and writing of the jobs still share it.
+
+Usage:
+    python benchmarks/bench_scheduler.py [--latency 0.1] [--max-jobs 3]
+"""
+
+
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'collectors_scheduler'))
+from mock_server import start_process
+from bench_pipelines import point_to
+import run_collectors
+
+def build_config(work_dir, max_jobs, args):
+    end = f'{2020 + (args.months - 1) // 12}-{(args.months - 1) % 12 + 1:02d}'
+    return {
+        'max_jobs': max_jobs,
+        'metrics_dir': os.path.join(work_dir, 'metrics'),
+        'log_level': 'WARNING',
+        'apis': {'gmb': {'concurrency': args.workers, 'qps': args.qps, 'burst': args.qps},
+                 'graph': {'concurrency': args.workers, 'qps': args.qps, 'burst': args.qps},
+                 'drive': {'qps': args.qps, 'burst': args.qps}},
+        'jobs': {
+            'gmb_locations': {'script': 'googlemaps_reviews', 'args': ['locations']},
+            'gmb_reviews': {'script': 'googlemaps_reviews', 'args': ['batch-reviews', '--format', 'csv'], 'after': ['gmb_locations']},
+            'fanpage_insights': {'script': 'fanpage_impressions_monthly', 'args': ['backfill', '2020-01', end, '--no-export'],
+                                 'settings': {'pages': [{'id': f'page{i}'} for i in range(args.fan_pages)]}},
+            'sheets_permissions': {'script': 'Google_Sheets_permissions', 'args': ['--output', 'csv'],
+                                   'settings': {'fileinfo': [{'file': f'sheet{i}', 'id': f'file{i}', 'filename': f'sheet{i}'}
+                                                             for i in range(args.files)]}},
+        },
+    }
+
+def slowest_chain(config, results):
+    """Return the seconds of the slowest chain of jobs, each job finishing after the jobs in its ``after`` list."""
+    finished = {}
+    def finish(name):
+        if name not in finished:
+            after = config['jobs'][name].get('after', [])
+            finished[name] = results[name]['seconds'] + max([finish(job) for job in after], default=0)
+        return finished[name]
+    return max(finish(name) for name in results)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collectors run one after the other and as concurrent jobs.')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every HTTP request')
+    parser.add_argument('--max-jobs', type=int, default=3, help='jobs run at the same time in the concurrent run')
+    parser.add_argument('--workers', type=int, default=4, help='concurrency of the Google My Business and Graph API budgets')
+    parser.add_argument('--qps', type=float, default=1000, help='request rate of every API budget')
+    parser.add_argument('--accounts', type=int, default=2, help='Google My Business accounts')
+    parser.add_argument('--locations', type=int, default=20, help='locations per account')
+    parser.add_argument('--reviews', type=int, default=60, help='reviews per location')
+    parser.add_argument('--fan-pages', type=int, default=20, help='Facebook fan pages')
+    parser.add_argument('--months', type=int, default=24, help='months of insights per fan page')
+    parser.add_argument('--files', type=int, default=300, help='Google Sheets')
+    parser.add_argument('--permissions', type=int, default=30, help='permissions per Google Sheet')
+    args = parser.parse_args()
+    args.cache = False
+    multiprocessing.set_start_method('fork')
+    import pandas # inherited by the forked jobs
+
+    process, url = start_process(latency=args.latency, locations=args.locations, reviews=args.reviews, permissions=args.permissions)
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        point_to(url, work_dir, args)
+        for max_jobs in [1, args.max_jobs]:
+            config = build_config(work_dir, max_jobs, args)
+            print(f'run max_jobs {max_jobs}')
+            runs.append((max_jobs, config, run_collectors.run(config)))
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    process.terminate()
+
+    print()
+    print(f'latency {args.latency}s, concurrency {args.workers}, qps {args.qps}')
+    print(f'{"job":<22}' + ''.join(f'{f"max_jobs {max_jobs}":>14}' for max_jobs, _, _ in runs))
+    for name in runs[0][1]['jobs']:
+        print(f'{name:<22}' + ''.join(f'{summary["jobs"][name]["seconds"]:>13.2f}s' for _, _, summary in runs))
+    print(f'{"wall time":<22}' + ''.join(f'{summary["seconds"]:>13.2f}s' for _, _, summary in runs))
+    print(f'{"slowest chain":<22}' + ''.join(f'{slowest_chain(config, summary["jobs"]):>13.2f}s' for _, config, summary in runs))
+    failed = [name for _, _, summary in runs for name, item in summary['jobs'].items() if item['status'] != 'ok']
+    if len(failed) > 0:
+        print(f'not finished: {", ".join(failed)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Startup benchmark of the scripts, the time a short cron run or a test pays before any work is done.
+
+Every measurement is a new Python process, repeated ``--repeat`` times (the median and the fastest run are reported):
+- python     : an empty interpreter, the floor of every other row.
+- import     : ``import <script>``, what a test or another script pays.
+- --help     : ``python <script> --help``, the command line parsed without any work.
+- eager      : importing the libraries which the script imported at the top before they were loaded lazily
+               (pandas, numpy, dask, gspread, googleapiclient ...), the libraries not installed are skipped.
+The modules with the longest cumulative import time (``python -X importtime``) of each script are listed.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--top 5]
+"""
+
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import importlib.util
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+scripts = [
+    # script, module, libraries imported at the top before they were loaded lazily
+    ('scrape_googlemaps_reviews/googlemaps_reviews.py', 'googlemaps_reviews', ['numpy', 'pandas', 'dask.dataframe']),
+    ('scrape_googlemaps_reviews/reviews_analytics.py', 'reviews_analytics', ['numpy', 'pandas', 'dask.dataframe']),
+    ('facebook_fanpage_data/fanpage_impressions_monthly.py', 'fanpage_impressions_monthly',
+     ['pandas', 'dask.dataframe', 'google.oauth2.service_account', 'gspread_dataframe', 'gspread']),
+    ('get_googlesheets_permissions/Google_Sheets_permissions.py', 'Google_Sheets_permissions',
+     ['pandas', 'googleapiclient.discovery', 'googleapiclient.errors', 'oauth2client.file']),
+]
+
+def installed(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+def run_seconds(args, repeat):
+    """Return the median and the fastest wall time of a command, each run in a new process."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=repo_dir)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+def import_code(script, module):
+    return f'import sys; sys.path.insert(0, {os.path.dirname(os.path.join(repo_dir, script))!r}); import {module}'
+
+def slowest_imports(script, module, top):
+    """Return the ``top`` modules with the longest cumulative import time (seconds) of importing the script."""
+    rst = subprocess.run([sys.executable, '-X', 'importtime', '-c', import_code(script, module)],
+                         capture_output=True, text=True, cwd=repo_dir, check=True)
+    items = []
+    for line in rst.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2].strip()
+            # only the modules imported by the script itself, not the modules they import
+            if len(parts[2]) - len(parts[2].lstrip()) <= 3 and name != module:
+                items.append((int(parts[1]) / 1e6, name))
+    return sorted(items, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the scripts.')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every measurement')
+    parser.add_argument('--top', type=int, default=5, help='slowest imports listed per script')
+    args = parser.parse_args()
+
+    rows = [('python', '-', run_seconds([sys.executable, '-c', 'pass'], args.repeat))]
+    details = []
+    for script, module, eager in scripts:
+        rows.append((module, 'import', run_seconds([sys.executable, '-c', import_code(script, module)], args.repeat)))
+        rows.append((module, '--help', run_seconds([sys.executable, script, '--help'], args.repeat)))
+        libraries = [name for name in eager if installed(name)]
+        rows.append((module, 'eager', run_seconds([sys.executable, '-c', f'import {", ".join(libraries)}'], args.repeat)))
+        details.append((module, libraries, slowest_imports(script, module, args.top)))
+
+    print(f'{"script":<30}{"run":<10}{"median s":>10}{"fastest s":>11}')
+    for module, run, (median, fastest) in rows:
+        print(f'{module:<30}{run:<10}{median:>10.3f}{fastest:>11.3f}')
+    for module, libraries, slowest in details:
+        print()
+        print(f'{module}: eager = {", ".join(libraries)}')
+        for seconds, name in slowest:
+            print(f'    {seconds:>7.3f}s  {name}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+A local stand-in for the Google My Business, Facebook Graph and Google Drive APIs, used by `bench_pipelines.py`
+to measure the scripts without credentials or network access.
+
+Every response is generated from the request, so any number of accounts, locations, reviews, months and files can be served:
+- Google My Business: the token endpoint, paginated locations, paginated reviews and batchGetReviews.
+- Facebook Graph: page insights of a month and batch requests (POST to the root URL).
+- Google Drive: paginated permissions of a file and batch requests (multipart/mixed, the same format as googleapiclient).
+
+Settings of `MockServer`:
+- ``latency``: seconds added to every HTTP request.
+- ``page_size``: the largest page returned, smaller than the page size asked by the scripts to force more pages.
+- ``throttle_every``: every n-th API call is answered with a rate-limit error (429, a Graph API error for Facebook), 0 to disable.
+- ``locations``, ``reviews``, ``permissions``: locations per account, reviews per location and permissions per file.
+
+Usage:
+    server = MockServer(latency=0.02, throttle_every=50).start()
+    print(server.url, server.stats())
+    server.stop()
+
+    # or in another process, so the server does not share the GIL and the memory with the measured script
+    process, url = start_process(latency=0.02)
+    requests.get(url + '/_stats').json()
+"""
+
+
+import json
+import multiprocessing
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+star_ratings = ['ONE', 'TWO', 'THREE', 'FOUR', 'FIVE']
+first_review_time = datetime(2024, 1, 1)
+
+class MockServer:
+    def __init__(self, latency=0.0, page_size=100, throttle_every=0, locations=100, reviews=120, permissions=30):
+        self.latency = latency
+        self.page_size = page_size
+        self.throttle_every = throttle_every
+        self.locations = locations
+        self.reviews = reviews
+        self.permissions = permissions
+        self.lock = threading.Lock()
+        self.reset()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0 # HTTP requests
+            self.calls = 0    # API calls, a batch request counts each of its calls
+            self.throttled = 0
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'calls': self.calls, 'throttled': self.throttled}
+
+    def count_call(self):
+        """Count an API call, return True if it is throttled."""
+        with self.lock:
+            self.calls += 1
+            if self.throttle_every > 0 and self.calls % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+            return False
+
+    def page(self, items, query, default_size):
+        """Return the page of ``items`` for the pageSize / pageToken of the query and the next page token."""
+        size = min(int(query.get('pageSize') or default_size), self.page_size)
+        start = int(query.get('pageToken') or 0)
+        next_token = str(start + size) if start + size < len(items) else None
+        return items[start:start + size], next_token
+
+    # Google My Business
+    def location(self, account, i):
+        return {
+            'name': f'locations/{account}-{i}',
+            'title': f'store {account}-{i}',
+            'storeCode': f'S{account}-{i:05d}',
+            'storefrontAddress': {
+                'regionCode': 'TW',
+                'postalCode': f'{100 + i % 900}',
+                'administrativeArea': '台北市',
+                'locality': f'區{i % 12}',
+                'addressLines': [f'路{i % 50}號'] + [f'{j}樓' for j in range(i % 3)]
+                }
+            }
+
+    def review(self, location, i):
+        # newest first, the same as orderBy updateTime desc
+        update_time = first_review_time + timedelta(hours=self.reviews - i)
+        review = {
+            'reviewId': f'{location}-review{i}',
+            'reviewer': {'displayName': f'user{i}'},
+            'starRating': star_ratings[(i * 7 + len(location)) % 5],
+            'comment': f'comment {i}\nof {location}',
+            'createTime': update_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'updateTime': update_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'name': f'{location}/reviews/review{i}'
+            }
+        if i % 3 == 0:
+            review['reviewReply'] = {'comment': 'thank you', 'updateTime': review['updateTime']}
+        return review
+
+    def locations_page(self, account, query):
+        items, next_token = self.page(range(self.locations), query, 100)
+        return {'locations': [self.location(account, i) for i in items], 'nextPageToken': next_token}
+
+    def reviews_page(self, location, query):
+        items, next_token = self.page(range(self.reviews), query, 50)
+        stars = [star_ratings.index(self.review(location, i)['starRating']) + 1 for i in range(self.reviews)]
+        return {
+            'reviews': [self.review(location, i) for i in items],
+            'averageRating': round(sum(stars) / len(stars), 1) if len(stars) > 0 else 0,
+            'totalReviewCount': self.reviews,
+            'nextPageToken': next_token
+            }
+
+    def batch_reviews_page(self, body):
+        location_names = body.get('locationNames', [])
+        # the reviews of all locations, one location after the other
+        items, next_token = self.page(range(len(location_names) * self.reviews), {'pageSize': body.get('pageSize'),
+                                                                                  'pageToken': body.get('pageToken')}, 50)
+        reviews = [{'name': location_names[i // self.reviews],
+                    'review': self.review(location_names[i // self.reviews].split('/', 2)[-1], i % self.reviews)} for i in items]
+        return {'locationReviews': reviews, 'nextPageToken': next_token}
+
+    # Facebook Graph
+    def insights(self, page, query):
+        month = query.get('since', '')[:7]
+        return {'data': [{'name': metric, 'period': 'total_over_range',
+                          'values': [{'value': len(page) * 1000 + int(month.replace('-', '') or 0) % 1000 + k}]}
+                         for k, metric in enumerate(query.get('metric', '').split(','))]}
+
+    def graph_batch(self, form):
+        responses = []
+        for request in json.loads(form.get('batch', '[]')):
+            if self.count_call():
+                responses.append({'code': 403, 'body': json.dumps(graph_error)})
+                continue
+            u = urlparse(request['relative_url'])
+            page = u.path.strip('/').split('/')[0]
+            responses.append({'code': 200, 'body': json.dumps(self.insights(page, query_dict(u.query)))})
+        return responses
+
+    # Google Drive
+    def permissions_page(self, fileid, query):
+        items, next_token = self.page(range(self.permissions), query, 100)
+        return {'permissions': [{'displayName': f'user{i}', 'emailAddress': f'user{i}@example.com',
+                                 'role': 'writer' if i % 5 == 0 else 'reader'} for i in items],
+                'nextPageToken': next_token}
+
+    def drive_call(self, method, path):
+        """Return the status and body of one Drive API call, also a call inside a batch request."""
+        if self.count_call():
+            return 429, drive_error
+        u = urlparse(path)
+        m = re.search(r'/files/([^/]+)/permissions$', u.path)
+        if m:
+            return 200, self.permissions_page(m.group(1), query_dict(u.query))
+        return 404, {'error': {'code': 404, 'message': f'{method} {u.path} not found'}}
+
+    def drive_batch(self, content_type, body):
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1)
+        out = []
+        for part in body.split('--' + boundary):
+            content_id = re.search(r'Content-ID: <([^>]+)>', part)
+            request_line = re.search(r'^(GET|POST) (\S+)', part, re.M)
+            if content_id is None or request_line is None:
+                continue
+            status, data = self.drive_call(request_line.group(1), request_line.group(2))
+            out.append(f'--batch_mock\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id.group(1)}>\r\n\r\n'
+                       f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\nContent-Type: application/json\r\n\r\n'
+                       f'{json.dumps(data)}\r\n')
+        out.append('--batch_mock--')
+        return 'multipart/mixed; boundary=batch_mock', ''.join(out)
+
+graph_error = {'error': {'code': 4, 'message': 'Application request limit reached'}}
+drive_error = {'error': {'code': 429, 'message': 'Rate limit exceeded', 'errors': [{'reason': 'rateLimitExceeded'}]}}
+
+def serve(conn, settings):
+    server = MockServer(**settings)
+    conn.send(server.url)
+    server.httpd.serve_forever()
+
+def start_process(**settings):
+    """Start a `MockServer` in a daemon process, return the process and the server URL."""
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child_conn, settings), daemon=True)
+    process.start()
+    return process, parent_conn.recv()
+
+def query_dict(query):
+    return {k: v[0] for k, v in parse_qs(query).items()}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, the same as the real APIs
+    disable_nagle_algorithm = True # the headers and the body are written separately
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, data, content_type='application/json', headers=None):
+        body = (data if isinstance(data, str) else json.dumps(data)).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+
+    def do_GET(self):
+        self.handle_request('GET', None)
+
+    def do_POST(self):
+        self.handle_request('POST', self.read_body())
+
+    def handle_request(self, method, body):
+        mock = self.server.mock
+        if self.path == '/_stats':
+            return self.send(200, mock.stats())
+        if self.path == '/_reset':
+            mock.reset()
+            return self.send(200, mock.stats())
+        with mock.lock:
+            mock.requests += 1
+        if mock.latency > 0:
+            time.sleep(mock.latency)
+        u = urlparse(self.path)
+        query = query_dict(u.query)
+        path = u.path
+
+        if path == '/token':
+            return self.send(200, {'access_token': 'mock-token', 'expires_in': 3600})
+        if path.startswith('/batch/drive'):
+            content_type, data = mock.drive_batch(self.headers['Content-Type'], body)
+            return self.send(200, data, content_type)
+        if path.startswith('/drive/'):
+            status, data = mock.drive_call(method, self.path)
+            return self.send(status, data)
+        if path == '/' and method == 'POST':
+            return self.send(200, mock.graph_batch(query_dict(body)))
+
+        if mock.count_call():
+            if path.endswith('/insights/') or path.endswith('/insights'):
+                return self.send(403, graph_error)
+            return self.send(429, drive_error, headers={'Retry-After': '0'})
+        m = re.match(r'^/v1/accounts/([^/]+)/locations$', path)
+        if m:
+            return self.send(200, mock.locations_page(m.group(1), query))
+        m = re.match(r'^/v4/accounts/[^/]+/(locations/[^/]+)/reviews$', path)
+        if m:
+            return self.send(200, mock.reviews_page(m.group(1), query))
+        if path.endswith('/locations:batchGetReviews'):
+            return self.send(200, mock.batch_reviews_page(json.loads(body)))
+        m = re.match(r'^/([^/]+)/insights/?$', path)
+        if m:
+            return self.send(200, mock.insights(m.group(1), query))
+        self.send(404, {'error': {'code': 404, 'message': f'{method} {path} not found'}})
@@ -0,0 +1,201 @@
+"""
+This script runs the collectors of this repository as one nightly workload from one config file,
+instead of a cron job per script with the settings hard-coded at the top of each script.
+
+- Jobs: every job runs the `main()` of one script with the job's command line arguments, in its own process.
+  The settings of the config replace the configuration globals at the top of the script (paths, ids, files).
+- Concurrency: up to ``max_jobs`` jobs run at the same time, a job starts as soon as the jobs in its ``after`` list are finished.
+  Two jobs of the same API never run at the same time, so the budget of an API holds for the whole run.
+- API budgets: ``concurrency`` (the worker threads of the script) and ``qps`` / ``burst`` (a shared `RateLimiter`) per API.
+  ``qps`` counts API calls, a batch request (Drive, Graph API) takes one token per request in it.
+- Inside a job, fetching, transforming and writing overlap through `api_utils.pipeline`, so the run takes about as long
+  as the slowest API instead of the sum of all scripts.
+- Each job saves its run metrics to ``metrics_dir``/<job>.json, the status and time of every job are saved to `summary_filename`.
+- A failed or timed out job does not stop the other jobs, only the jobs after it are skipped. The exit code is 1 if a job did not finish.
+
+Config (JSON):
+    {
+        "max_jobs": 3,
+        "metrics_dir": "...",
+        "log_level": "INFO",
+        "apis": {"gmb": {"concurrency": 4, "qps": 5, "burst": 10}, ...},
+        "settings": {"googlemaps_reviews": {"save_dir": "..."}, ...},  # for every job which imports the script
+        "jobs": {
+            "gmb_reviews": {"script": "googlemaps_reviews", "args": ["batch-reviews"], "after": ["gmb_locations"],
+                            "settings": {...}, "timeout": 7200},
+            ...
+        }
+    }
+
+Usage:
+    python run_collectors.py [collectors.json] [--jobs gmb_reviews ...]
+"""
+
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import multiprocessing
+import multiprocessing.connection
+from datetime import datetime
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_dir)
+from api_utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'collectors.json')
+summary_filename = 'run_collectors.json' # saved in metrics_dir
+
+collectors = {
+    # script: its folder, the API of its budget and the setting of its worker threads
+    'googlemaps_reviews': {'folder': 'scrape_googlemaps_reviews', 'api': 'gmb', 'concurrency': 'max_workers'},
+    'reviews_analytics': {'folder': 'scrape_googlemaps_reviews', 'api': None, 'concurrency': None},
+    'fanpage_impressions_monthly': {'folder': 'facebook_fanpage_data', 'api': 'graph', 'concurrency': 'fb_max_workers'},
+    'Google_Sheets_permissions': {'folder': 'get_googlesheets_permissions', 'api': 'drive', 'concurrency': None},
+}
+
+def read_config(fn):
+    with open(fn, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    for name, job in config.get('jobs', {}).items():
+        if job.get('script') not in collectors:
+            raise ValueError(f'job {name}: unknown script {job.get("script")}, one of {", ".join(collectors)}')
+        unknown = set(job.get('after', [])) - set(config['jobs'])
+        if len(unknown) > 0:
+            raise ValueError(f'job {name}: unknown jobs in after: {", ".join(sorted(unknown))}')
+    return config
+
+def apply_settings(module, settings):
+    """Replace the configuration globals of a script, only the names the script already has are accepted."""
+    for key, value in settings.items():
+        if not hasattr(module, key):
+            raise ValueError(f'unknown setting of {module.__name__}: {key}')
+        setattr(module, key, value)
+
+def apply_budget(module, script, budget):
+    """Set the worker threads and the request rate of a script from the budget of its API."""
+    for key in budget:
+        if key not in {'concurrency', 'qps', 'burst'}:
+            raise ValueError(f'unknown budget of {collectors[script]["api"]}: {key}')
+    if 'concurrency' in budget:
+        if collectors[script]['concurrency'] is None:
+            raise ValueError(f'the concurrency of {script} cannot be set, it sends one request at a time')
+        setattr(module, collectors[script]['concurrency'], budget['concurrency'])
+    if 'qps' in budget:
+        module.rate_limiter = RateLimiter(budget['qps'], budget.get('burst', max(1, budget['qps'])))
+
+def run_job(name, job, config):
+    """Run one job, in its own process (the scripts change the working directory and keep their state in globals)."""
+    logging.basicConfig(level=config.get('log_level', 'INFO'), format=f'%(asctime)s {name} %(levelname)s %(message)s', force=True)
+    script = job['script']
+    sys.path.append(os.path.join(repo_dir, collectors[script]['folder']))
+    module = importlib.import_module(script)
+    # the settings of every script the job imports, e.g. googlemaps_reviews for reviews_analytics
+    for script_name, settings in config.get('settings', {}).items():
+        if script_name in sys.modules:
+            apply_settings(sys.modules[script_name], settings)
+    apply_settings(module, job.get('settings', {}))
+    api = collectors[script]['api']
+    if api is not None:
+        apply_budget(module, script, config.get('apis', {}).get(api, {}))
+
+    args = list(job.get('args', []))
+    if config.get('metrics_dir') and '--metrics' not in args:
+        os.makedirs(config['metrics_dir'], exist_ok=True)
+        args += ['--metrics', os.path.join(os.path.abspath(config['metrics_dir']), f'{name}.json')]
+    module.main(args)
+
+def run(config, names=None):
+    """
+        Run the jobs of the config (only ``names`` if given, their ``after`` jobs which are not selected are not waited for),
+        returns the status ('ok', 'failed', 'timeout' or 'skipped'), exit code and seconds of every job.
+    """
+    jobs = config['jobs']
+    names = list(jobs) if names is None else names
+    max_jobs = config.get('max_jobs', len(names))
+    pending = list(names)
+    running = {}  # name -> process, API, start and deadline
+    results = {}
+    start = time.monotonic()
+
+    def finish(name, status, exitcode=None):
+        seconds = time.monotonic() - running.pop(name)['start'] if name in running else 0
+        results[name] = {'status': status, 'exitcode': exitcode, 'seconds': round(seconds, 3)}
+        log = logger.info if status == 'ok' else logger.error
+        log('%s %s in %.1fs', name, status, seconds)
+
+    while len(pending) > 0 or len(running) > 0:
+        for name in list(pending):
+            after = [job for job in jobs[name].get('after', []) if job in names]
+            if any(job in results and results[job]['status'] != 'ok' for job in after):
+                pending.remove(name)
+                finish(name, 'skipped')
+                continue
+            if not all(job in results for job in after) or len(running) >= max_jobs:
+                continue
+            api = collectors[jobs[name]['script']]['api']
+            if api is not None and any(item['api'] == api for item in running.values()):
+                continue
+            process = multiprocessing.Process(target=run_job, args=(name, jobs[name], config), name=name)
+            process.start()
+            timeout = jobs[name].get('timeout')
+            running[name] = {'process': process, 'api': api, 'start': time.monotonic(),
+                             'deadline': None if timeout is None else time.monotonic() + timeout}
+            pending.remove(name)
+            logger.info('%s started', name)
+        if len(running) == 0:
+            # the rest waits for each other (a cycle in after)
+            for name in pending:
+                finish(name, 'skipped')
+            break
+
+        deadlines = [item['deadline'] for item in running.values() if item['deadline'] is not None]
+        timeout = max(min(deadlines) - time.monotonic(), 0) if len(deadlines) > 0 else None
+        multiprocessing.connection.wait([item['process'].sentinel for item in running.values()], timeout)
+        for name, item in list(running.items()):
+            process = item['process']
+            if not process.is_alive():
+                process.join()
+                finish(name, 'ok' if process.exitcode == 0 else 'failed', process.exitcode)
+            elif item['deadline'] is not None and time.monotonic() >= item['deadline']:
+                process.terminate()
+                process.join()
+                finish(name, 'timeout', process.exitcode)
+
+    return {'seconds': round(time.monotonic() - start, 3), 'jobs': results}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the collectors as concurrent jobs from one config file.')
+    parser.add_argument('config', nargs='?', default=config_file, help='the config file (JSON)')
+    parser.add_argument('--jobs', nargs='+', metavar='job', help='only run these jobs')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s scheduler %(levelname)s %(message)s')
+    config = read_config(args.config)
+    unknown = set(args.jobs or []) - set(config['jobs'])
+    if len(unknown) > 0:
+        raise SystemExit(f'unknown jobs: {", ".join(sorted(unknown))}')
+
+    started = datetime.now()
+    summary = run(config, args.jobs)
+    summary['started'] = started.isoformat(timespec='seconds')
+    for name, item in summary['jobs'].items():
+        logger.info('%-24s %-8s %8.1fs', name, item['status'], item['seconds'])
+    logger.info('all jobs finished in %.1fs', summary['seconds'])
+    if config.get('metrics_dir'):
+        os.makedirs(config['metrics_dir'], exist_ok=True)
+        with open(os.path.join(config['metrics_dir'], summary_filename), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if any(item['status'] != 'ok' for item in summary['jobs'].values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
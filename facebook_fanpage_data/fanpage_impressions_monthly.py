@@ -1,159 +1,527 @@
-"""
-This script retrieves monthly impression data from your Facebook fan page
-and stores the data in a specified Google Sheet.
-
-- Automates the process of fetching fan page impression metrics on a monthly basis.
-- Integrates with the Facebook Graph API for reliable data retrieval.
-- Utilizes the Google Sheets API to store and update the data seamlessly.
-- Ensures data accuracy and provides a scalable solution for long-term tracking.
-
-Prerequisites:
-- Facebook Graph API access token with permissions to read insights.
-- Google Cloud credentials for accessing the Google Sheets API.
-
-"""
-
-
-import os
-import glob
-import requests
-import pandas as pd
-import dask.dataframe as dd
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from google.oauth2.service_account import Credentials
-from gspread_dataframe import set_with_dataframe
-import gspread
-import calendar
-
-# Prepare for your Facebook integration
-token_file = r'C:\Users\Vivian\Desktop\FB粉絲專頁\粉絲專頁token.txt' # Facebook Graph API access token
-page_id = 'fanpageid' # Facebook fanpage id
-url = f'https://graph.facebook.com/{page_id}/insights/' # Facebook api
-
-# Set up Google Cloud credentials and the target Google Sheet ID
-credential_dir=r'C:\Users\Vivian\Desktop\credentials.json'
-sheet_key='googlesheetid' 
-
-# Set month range
-date_now = datetime.now().date()
-rnge_std = -1  # start from last month
-rnge_end = -1  
-
-def get_token():
-    """Read token file"""
-    with open(token_file, 'r') as f:
-        data = f.read()
-    return data
-    
-def connect_googlesheet():
-    """Connect to the target Google Sheet"""
-    scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-    credentials = Credentials.from_service_account_file(credential_dir, scopes=scopes)
-    gc = gspread.authorize(credentials)
-    gs = gc.open_by_key(sheet_key)
-    return gs
-
-def connect_worksheet(year):
-    """
-        Connect to the specific worksheet tab for the given year in the Google Sheet.
-        # This function first attempts to access an existing worksheet with the name '{year}_monthly'.
-        # If the worksheet doesn't exist, it will create a new tab with the specified name and set default dimensions.
-    """
-    gs = connect_googlesheet()
-    try:
-        worksheet = gs.worksheet(f'{year}_monthly')
-    except:
-        gs.add_worksheet(title=f'{year}_monthly', rows=1000, cols=20)
-        worksheet = gs.worksheet(f'{year}_monthly')       
-    return gs, worksheet
-
-def fb_page_data(date):
-    """
-        Return Facebook fan page data (impressions) for a given month.
-        :param metric: Specifies which metrics to retrieve. In this case, 'page_impressions' and 'page_impressions_unique' are chosen.
-        :param period: Defines the period for the data aggregation. Here, it is set to 'total_over_range' to get the total impressions during the specified date range.
-    """
-    until_date = date + relativedelta(months=1)
-    page_access_token = get_token()
-    params = {
-            'metric': 'page_impressions,page_impressions_unique', # metrics to retrieve
-            'access_token': page_access_token,
-            'since': date.strftime('%Y-%m-01'), 
-            'until': until_date.strftime('%Y-%m-01'),
-            'period': 'total_over_range'
-          }
-    
-    r = requests.get(url,params=params).json()
-    
-    blank = []
-    try:
-        for datas in r['data']:
-            metric = datas['name'] 
-            d = datas['values'] 
-            df = pd.DataFrame.from_records(d)
-            df['month'] = int(date.strftime('%Y%m'))
-            df['year'] = int(date.strftime('%Y'))
-            df[f'{metric}'] = df['value']
-            df = df.drop(['end_time', 'value'], axis=1)
-            blank.append(df)
-    except:
-        pass
-    if len(blank) > 0:
-        df = pd.concat(blank, axis=1)
-        df = df.loc[:,~df.columns.duplicated()]
-        return df
-
-def to_googlesheet(dff, eachyear):  
-    """
-        Updates new data into Google Sheet, merging it with existing data, removing duplicates, 
-        and ensuring accurate monthly records.
-    """
-    gs, worksheet = connect_worksheet(eachyear)
-    
-    df_new = dff
-    df_old = pd.DataFrame(worksheet.get_all_records())
-    
-    if df_old.empty == True:
-        df = df_new
-    else:
-        df = pd.concat([df_old, df_new], sort=False)
-    df.drop_duplicates(subset=['month'], keep='last', inplace=True, ignore_index=True)
-        
-    worksheet.clear()
-    set_with_dataframe(worksheet=worksheet, dataframe=df, include_index=False, include_column_header=True, resize=True)
-    print('Update Successfully!')
-
-def groupby_year(df): 
-    """
-        Groups the data by year and updates each year's data to the corresponding Google Sheet.
-        ``to_googlesheet(df, year)`` 
-          - The DataFrame `df` is split by year.
-          - The data for each year is stored in the respective worksheet named 'year' in Google Sheets.
-    """
-    grouped = df.groupby(df.year)
-    for year in df.year.unique():
-        df = grouped.get_group(year)
-        df = df.drop(['year'], axis=1)
-        to_googlesheet(df, year)
-        print(f'finish concat {year}')
-
-def main_monthly_loop():
-    """Main function to execute the monthly data retrieval and update process."""
-    concat_df = []
-    for delta in range(rnge_std, rnge_end - 1, -1):
-        date_delta = date_now + relativedelta(months=delta)
-        forfb_date = date_delta
-        print(f'Start {forfb_date.strftime("%Y%m")}')
-        df = fb_page_data(forfb_date)
-        concat_df.append(df)
-    df = pd.concat(concat_df, ignore_index=1)
-    df = df.sort_values(by='month', ascending=True)
-    groupby_year(df)
-    
-def main():
-    print('Start')
-    main_monthly_loop()
-
-if __name__ == '__main__':
-    main()
+"""
+This script retrieves monthly impression data from your Facebook fan pages
+and stores the data in a specified Google Sheet.
+
+- Automates the process of fetching fan page impression metrics on a monthly basis.
+- Integrates with the Facebook Graph API for reliable data retrieval.
+- Collects any number of fan pages and metrics into a local Parquet store, partitioned by page and month.
+- Utilizes the Google Sheets API to export the data of the main fan page from the local store.
+- Ensures data accuracy and provides a scalable solution for long-term tracking.
+
+Prerequisites:
+- Facebook Graph API access token with permissions to read insights.
+- Google Cloud credentials for accessing the Google Sheets API.
+- pyarrow for the local Parquet store.
+
+Usage:
+    python fanpage_impressions_monthly.py [monthly]                  # last month of every page, then export to Google Sheets
+    python fanpage_impressions_monthly.py backfill 2019-01 2023-12   # reload a month range
+    options: [--no-export] [--metrics run_metrics.json] [--no-cache]
+"""
+
+
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import threading
+import functools
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from urllib.parse import urlencode
+import calendar
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_utils import cli, http_client, pipeline, response_cache
+from api_utils import metrics as run_metrics # `metrics` is the Graph API metrics setting below
+from api_utils.lazy import lazy_import
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+pa_dataset = lazy_import('pyarrow.dataset')
+
+logger = logging.getLogger(__name__)
+
+# Prepare for your Facebook integration
+token_file = r'C:\Users\Vivian\Desktop\FB粉絲專頁\粉絲專頁token.txt' # Facebook Graph API access token
+page_id = 'fanpageid' # Facebook fanpage id, the page exported to Google Sheets
+pages = [ 
+    # your fan page ids and their access token files
+    {'id': page_id, 'token_file': token_file}
+]
+graph_url = 'https://graph.facebook.com/' # Facebook api, also the endpoint for batch requests
+metrics = 'page_impressions,page_impressions_unique' # metrics to retrieve
+store_dir = r'C:\Users\Vivian\Desktop\FB粉絲專頁\insights' # local Parquet store, partitioned by page_id and month
+batch_size = 50     # months in one Graph API batch request (the Graph API allows up to 50)
+fb_max_workers = 4  # batch requests sent at the same time
+usage_threshold = 90 # pause when the Graph API rate-limit usage (percent) reaches this value
+graph_throttle_codes = {4, 17, 32, 613} # Graph API error codes of the rate limits (app, user, page, custom), retried after a pause
+graph_max_retries = 5 # retries of a request answered with a rate-limit error, any other error raises
+throttle_pause = 60  # seconds all requests wait after a rate-limit error without an estimated time to regain access, doubled with every retry
+rate_limiter = None  # an api_utils.rate_limit.RateLimiter for the Graph API requests (e.g. the budget of run_collectors), None = only the usage headers
+insights_cache_ttl = 86400 # seconds the insights of a month are served from the local response cache (api_utils.response_cache), 0 = always fetched
+run_metrics_file = os.path.join(store_dir, 'run_metrics.json') # latency per endpoint, stage timings and slowest pages of the run ('.prom' for Prometheus text), None to skip
+
+# Set up Google Cloud credentials and the target Google Sheet ID
+credential_dir=r'C:\Users\Vivian\Desktop\credentials.json'
+sheet_key='googlesheetid' 
+update_mode = 'upsert' # 'upsert': write only the new / changed months, 'rewrite': clear the worksheet and upload all data again
+spreadsheet = None  # cached connection, see connect_googlesheet()
+worksheets = None   # cached worksheet tabs by title, see connect_worksheet()
+
+# Set month range
+date_now = datetime.now().date()
+rnge_std = -1  # start from last month
+rnge_end = -1  
+
+@functools.lru_cache(maxsize=None)
+def get_token(path=token_file):
+    """Read token file, each token is read once and kept in memory"""
+    with open(path, 'r') as f:
+        data = f.read()
+    return data
+    
+def connect_googlesheet():
+    """
+        Connect to the target Google Sheet.
+        The service account is authorized and the spreadsheet is opened once, later calls reuse the same connection.
+    """
+    global spreadsheet
+    if spreadsheet is None:
+        # imported here, so a run without the export does not load the Google client libraries
+        from google.oauth2.service_account import Credentials
+        import gspread
+        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+        credentials = Credentials.from_service_account_file(credential_dir, scopes=scopes)
+        gc = gspread.authorize(credentials)
+        spreadsheet = gc.open_by_key(sheet_key)
+    return spreadsheet
+
+def connect_worksheet(year):
+    """
+        Connect to the specific worksheet tab for the given year in the Google Sheet.
+        # The worksheet list of the spreadsheet is fetched once and shared by all year tabs.
+        # If the worksheet '{year}_monthly' doesn't exist, it will create a new tab with the specified name and set default dimensions.
+    """
+    global worksheets
+    gs = connect_googlesheet()
+    if worksheets is None:
+        worksheets = {ws.title: ws for ws in gs.worksheets()}
+    title = f'{year}_monthly'
+    if title not in worksheets:
+        worksheets[title] = gs.add_worksheet(title=title, rows=1000, cols=20)
+    return gs, worksheets[title]
+
+graph_lock = threading.Lock()
+graph_paused_until = 0
+
+def pause_graph(seconds):
+    """Make all Graph API requests wait ``seconds`` from now (a longer pause already set is kept)."""
+    global graph_paused_until
+    with graph_lock:
+        graph_paused_until = max(graph_paused_until, time.time() + seconds)
+
+def graph_error(body):
+    """Return the code and message of a Graph API error body (a dict or its JSON text), (None, None) if it is not an error."""
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return None, None
+    error = body.get('error') if isinstance(body, dict) else None
+    if not isinstance(error, dict):
+        return None, None
+    return error.get('code'), error.get('message')
+
+def graph_usage(response):
+    """
+        Return the highest rate-limit usage (percent) and the seconds until access is regained,
+        from the X-App-Usage, X-Page-Usage and X-Business-Use-Case-Usage headers of a Graph API response.
+    """
+    usage = 0
+    regain_seconds = 0
+    for header in ['X-App-Usage', 'X-Page-Usage']:
+        if header in response.headers:
+            values = json.loads(response.headers[header])
+            usage = max([usage] + [v for k, v in values.items() if k in {'call_count', 'total_time', 'total_cputime'}])
+    if 'X-Business-Use-Case-Usage' in response.headers:
+        for items in json.loads(response.headers['X-Business-Use-Case-Usage']).values():
+            for item in items:
+                usage = max(usage, item.get('call_count', 0), item.get('total_time', 0), item.get('total_cputime', 0))
+                regain_seconds = max(regain_seconds, item.get('estimated_time_to_regain_access', 0) * 60)
+    return usage, regain_seconds
+
+def graph_request(method, request_url, calls=1, **kwargs):
+    """
+        Send a Graph API request and honor the rate-limit headers, ``calls`` is the number of API calls it counts as for `rate_limiter`
+        (the requests of a batch request).
+        When the usage reaches `usage_threshold`, all later requests wait until the usage window recovers
+        (the estimated time to regain access, or one minute). A fresh response of the response cache is returned without waiting.
+        - A rate-limit error (`graph_throttle_codes`) pauses all requests and the request is sent again, up to `graph_max_retries` times.
+        - Any other error (e.g. an expired token), or a rate-limit error left after the retries, raises an HTTP error,
+          so a month is never dropped without notice.
+    """
+    response = http_client.cached(method, request_url, **kwargs)
+    if response is not None:
+        return response
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire(calls)
+        while True:
+            with graph_lock:
+                wait = graph_paused_until - time.time()
+            if wait <= 0:
+                break
+            logger.warning('Graph API rate limit, wait %.0fs', wait)
+            time.sleep(wait)
+        
+        response = http_client.request(method, request_url, **kwargs)
+        usage, regain_seconds = graph_usage(response)
+        if usage >= usage_threshold or regain_seconds > 0:
+            run_metrics.count('quota_hits')
+            pause_graph(max(regain_seconds, 60))
+        if response.status_code < 400:
+            return response
+        code, message = graph_error(response.text)
+        if code in graph_throttle_codes and attempt < graph_max_retries:
+            run_metrics.count('quota_hits')
+            delay = max(regain_seconds, throttle_pause * 2 ** attempt)
+            pause_graph(delay)
+            logger.warning('Graph API rate limit (code %s) from %s, retry in %.0fs', code, request_url, delay)
+            attempt += 1
+            continue
+        logger.error('Graph API error %s from %s: %s', code, request_url, message)
+        response.raise_for_status()
+
+def insights_params(date, metric=None):
+    """Return the insights query of a given month, of the `metrics` setting if ``metric`` is None."""
+    until_date = date + relativedelta(months=1)
+    params = {
+            'metric': metrics if metric is None else metric,
+            'since': date.strftime('%Y-%m-01'), 
+            'until': until_date.strftime('%Y-%m-01'),
+            'period': 'total_over_range'
+          }
+    return params
+
+def page_records(r, date, page):
+    """
+        Return the insights response of a page for a given month as records, one record per metric value.
+        Numeric values are kept in 'value', breakdown values (dicts) are kept as JSON text in 'value_json'.
+    """
+    records = []
+    for datas in r.get('data', []):
+        for d in datas.get('values', []):
+            value = d.get('value')
+            records.append({
+                'page_id': page['id'],
+                'month': int(date.strftime('%Y%m')),
+                'year': int(date.strftime('%Y')),
+                'metric': datas['name'],
+                'value': value if isinstance(value, (int, float)) else None,
+                'value_json': json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else ''
+                })
+    return records
+
+def pivot_metrics(df):
+    """Return the records as one row per page and month, one column per metric (the Google Sheet format)."""
+    df = df.pivot_table(index=['page_id', 'month', 'year'], columns='metric', values='value', aggfunc='last').reset_index()
+    df.columns.name = None
+    for col in df.columns[3:]:
+        if (df[col].dropna() % 1 == 0).all():
+            df[col] = df[col].astype('Int64')
+    return df
+
+def fb_page_records(date, page, metric=None):
+    """Return the insights records of a page for a given month."""
+    params = insights_params(date, metric)
+    params['access_token'] = get_token(page.get('token_file', token_file))
+    
+    with run_metrics.stage('fetch', key=page['id']):
+        response = graph_request('GET', f"{graph_url}{page['id']}/insights/", params=params, cache_ttl=insights_cache_ttl)
+    with run_metrics.stage('parse'):
+        r = response.json()
+    with run_metrics.stage('transform'):
+        return page_records(r, date, page)
+
+def fb_page_data(date):
+    """
+        Return Facebook fan page data (impressions) for a given month.
+        :param metric: Specifies which metrics to retrieve. In this case, 'page_impressions' and 'page_impressions_unique' are chosen.
+        :param period: Defines the period for the data aggregation. Here, it is set to 'total_over_range' to get the total impressions during the specified date range.
+    """
+    records = fb_page_records(date, {'id': page_id, 'token_file': token_file})
+    if len(records) > 0:
+        df = pivot_metrics(pd.DataFrame(records))
+        return df.drop(['page_id'], axis=1)
+
+def fb_page_data_batch(dates, page, metric=None):
+    """
+        Return the insights records of a page for up to `batch_size` months with one Graph API batch request.
+        A month whose batch response is empty or failed is requested again on its own with `fb_page_records()`,
+        and the batch response is then removed from the response cache, so the next run asks the whole batch again.
+    """
+    batch = [{'method': 'GET', 'relative_url': f"{page['id']}/insights/?{urlencode(insights_params(date, metric))}"} for date in dates]
+    data = {
+            'access_token': get_token(page.get('token_file', token_file)),
+            'batch': json.dumps(batch),
+            'include_headers': 'false'
+          }
+    with run_metrics.stage('fetch', key=page['id']):
+        response = graph_request('POST', graph_url, calls=len(dates), data=data, cache_ttl=insights_cache_ttl)
+    with run_metrics.stage('parse'):
+        responses = response.json()
+    if not isinstance(responses, list):
+        # the whole batch failed, e.g. {'error': ...}
+        responses = [None] * len(dates)
+    
+    if any(r is None or r.get('code') != 200 for r in responses) and getattr(response, 'cache_key', None) is not None:
+        response_cache.delete(response.cache_key)
+    
+    if any(r is not None and graph_error(r.get('body'))[0] in graph_throttle_codes for r in responses):
+        # the months are requested again on their own, after the pause of a rate-limit error
+        run_metrics.count('quota_hits')
+        pause_graph(throttle_pause)
+    
+    records = []
+    for date, response in zip(dates, responses):
+        if response is None or response.get('code') != 200:
+            logger.info('Retry %s %s', page['id'], date.strftime('%Y%m'))
+            records.extend(fb_page_records(date, page, metric))
+        else:
+            with run_metrics.stage('transform'):
+                records.extend(page_records(json.loads(response['body']), date, page))
+    return records
+
+def collect_pages(pages, dates, metric=None):
+    """
+        Fetch the given months of every page with concurrent Graph API batch requests,
+        write the records to the local store and return them as one DataFrame.
+        The batches go through `pipeline.run()`: `fb_max_workers` batch requests are sent at the same time,
+        while the records of the finished batches are written to the store (each batch has its own page and month partitions).
+    """
+    columns = ['page_id', 'month', 'year', 'metric', 'value', 'value_json']
+    tasks = [(dates[i:i + batch_size], page) for page in pages for i in range(0, len(dates), batch_size)]
+    frames = {} # task index -> records, the returned DataFrame keeps the order of the tasks
+    
+    def sink(task, df):
+        with run_metrics.stage('write'):
+            write_store(df)
+        frames[task[0]] = df
+    
+    pipeline.run(enumerate(tasks), lambda task: fb_page_data_batch(*task[1], metric),
+                 transform=lambda task, records: pd.DataFrame.from_records(records, columns=columns),
+                 sink=sink, fetch_workers=fb_max_workers)
+    df = pd.concat([frames[i] for i in sorted(frames)], ignore_index=True) if len(frames) > 0 else pd.DataFrame(columns=columns)
+    logger.info('Collected %d pages, %d months, %d values', len(pages), len(dates), len(df))
+    return df
+
+def write_store(df):
+    """Write the records to the local Parquet store, the partitions (page and month) in `df` are replaced."""
+    if len(df) == 0:
+        return
+    df.to_parquet(store_dir, partition_cols=['page_id', 'month'], index=False,
+                  existing_data_behavior='delete_matching')
+
+def read_store(page=None, months=None):
+    """Read the records of the local store, only the partitions of the given page and months are loaded."""
+    filters = []
+    if page is not None:
+        filters.append(('page_id', '=', str(page)))
+    if months is not None:
+        filters.append(('month', 'in', [int(m) for m in months]))
+    # page ids are read as strings, pyarrow would infer numeric ids (all real page ids) as integers
+    partitioning = pa_dataset.partitioning(pa.schema([('page_id', pa.string()), ('month', pa.int32())]), flavor='hive')
+    df = pd.read_parquet(store_dir, filters=filters or None, partitioning=partitioning)
+    df['page_id'] = df['page_id'].astype(str)
+    df['month'] = df['month'].astype(int)
+    return df
+
+def export_to_googlesheet(page=page_id, dates=None):
+    """Export the data of a page from the local store to Google Sheets, one worksheet per year."""
+    months = None if dates is None else [date.strftime('%Y%m') for date in dates]
+    df = pivot_metrics(read_store(page, months))
+    df = df.drop(['page_id'], axis=1)
+    df = df.sort_values(by='month', ascending=True)
+    groupby_year(df)
+
+def month_range(start, end):
+    """Return the first day of each month from `start` to `end` (inclusive), e.g. month_range('2021-01', '2023-12')."""
+    start = pd.Timestamp(start).date().replace(day=1)
+    end = pd.Timestamp(end).date().replace(day=1)
+    dates = []
+    while start <= end:
+        dates.append(start)
+        start = start + relativedelta(months=1)
+    return dates
+
+def sheet_value(value):
+    """Return a DataFrame value as a plain Python value for the Sheets API."""
+    if pd.isna(value):
+        return ''
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def column_letter(col):
+    """Return the A1 column letter of a 1-based column number."""
+    import gspread
+    return gspread.utils.rowcol_to_a1(1, col)[:-1]
+
+def upsert_googlesheet(dff, eachyear):
+    """
+        Upserts the data into the Google Sheet by the 'month' key, so the write cost follows the size of the change.
+        - Reads only the header row and the 'month' column, then the existing rows of the months in `dff`.
+        - New months are appended below the last row, changed months are overwritten in place, unchanged months are skipped.
+        - All changed ranges are written with one batched values.batchUpdate request.
+    """
+    gs, worksheet = connect_worksheet(eachyear)
+    title = worksheet.title.replace("'", "''")
+    unformatted = {'valueRenderOption': 'UNFORMATTED_VALUE'}
+    
+    # the header row and the first column in one request, 'month' is usually the first column
+    header_range, first_col_range = gs.values_batch_get([f"'{title}'!1:1", f"'{title}'!A:A"], params=unformatted)['valueRanges']
+    header = header_range.get('values', [[]])[0]
+    first_col = first_col_range.get('values', [])
+    if 'month' in header and header.index('month') > 0:
+        col = column_letter(header.index('month') + 1)
+        month_col = gs.values_batch_get([f"'{title}'!{col}:{col}"], params=unformatted)['valueRanges'][0].get('values', [])
+    elif 'month' in header:
+        month_col = first_col
+    else:
+        month_col = []
+    month_rows = {str(row[0]): i + 1 for i, row in enumerate(month_col) if i > 0 and len(row) > 0}
+    last_row = max(len(first_col), len(month_col), 1)
+    
+    new_header = header + [col for col in dff.columns if col not in header]
+    last_col = column_letter(len(new_header))
+    key = new_header.index('month')
+    new_rows = [[sheet_value(row.get(col, '')) for col in new_header] for row in dff.to_dict('records')]
+    
+    # read back only the existing rows of the months to update
+    existing = [month_rows[str(row[key])] for row in new_rows if str(row[key]) in month_rows]
+    old_rows = {}
+    if len(existing) > 0:
+        value_ranges = gs.values_batch_get([f"'{title}'!A{r}:{last_col}{r}" for r in existing], params=unformatted)['valueRanges']
+        old_rows = {r: value_range.get('values', [[]])[0] for r, value_range in zip(existing, value_ranges)}
+    
+    data = []
+    if new_header != header:
+        data.append({'range': f"'{title}'!A1:{last_col}1", 'values': [new_header]})
+    for row in new_rows:
+        month = str(row[key])
+        if month not in month_rows:
+            last_row += 1
+            month_rows[month] = last_row
+        r = month_rows[month]
+        if r in old_rows:
+            old_row = old_rows[r] + [''] * (len(new_header) - len(old_rows[r]))
+            if [str(x) for x in old_row] == [str(x) for x in row]:
+                continue
+        data.append({'range': f"'{title}'!A{r}:{last_col}{r}", 'values': [row]})
+    
+    if len(data) == 0:
+        logger.info('No change')
+        return
+    if last_row > worksheet.row_count:
+        worksheet.add_rows(last_row - worksheet.row_count)
+    if len(new_header) > worksheet.col_count:
+        worksheet.add_cols(len(new_header) - worksheet.col_count)
+    gs.values_batch_update({'valueInputOption': 'USER_ENTERED', 'data': data})
+    logger.info('Update Successfully! %d ranges', len(data))
+
+def to_googlesheet(dff, eachyear, mode=None):  
+    """
+        Updates new data into Google Sheet, merging it with existing data, removing duplicates, 
+        and ensuring accurate monthly records.
+        ``mode='upsert'`` writes only the new and changed months with `upsert_googlesheet()`,
+        ``mode='rewrite'`` downloads the whole worksheet, clears it and uploads all data again.
+        None uses `update_mode` (read at the call, so a changed setting applies).
+    """
+    mode = update_mode if mode is None else mode
+    if mode == 'upsert':
+        upsert_googlesheet(dff, eachyear)
+        return
+    from gspread_dataframe import set_with_dataframe
+    gs, worksheet = connect_worksheet(eachyear)
+    
+    df_new = dff
+    df_old = pd.DataFrame(worksheet.get_all_records())
+    
+    if df_old.empty == True:
+        df = df_new
+    else:
+        df = pd.concat([df_old, df_new], sort=False)
+    df.drop_duplicates(subset=['month'], keep='last', inplace=True, ignore_index=True)
+        
+    worksheet.clear()
+    set_with_dataframe(worksheet=worksheet, dataframe=df, include_index=False, include_column_header=True, resize=True)
+    logger.info('Update Successfully!')
+
+def groupby_year(df): 
+    """
+        Groups the data by year and updates each year's data to the corresponding Google Sheet.
+        ``to_googlesheet(df, year)`` 
+          - The DataFrame `df` is split by year.
+          - The data for each year is stored in the respective worksheet named 'year' in Google Sheets.
+    """
+    grouped = df.groupby(df.year)
+    for year in df.year.unique():
+        df = grouped.get_group(year)
+        df = df.drop(['year'], axis=1)
+        with run_metrics.stage('write', key=f'Google Sheets {year}'):
+            to_googlesheet(df, year)
+        logger.info('finish concat %s', year)
+
+def main_monthly_loop(export=True):
+    """Main function to execute the monthly data retrieval and update process."""
+    dates = []
+    for delta in range(rnge_std, rnge_end - 1, -1):
+        date_delta = date_now + relativedelta(months=delta)
+        forfb_date = date_delta.replace(day=1)
+        logger.info('Start %s', forfb_date.strftime('%Y%m'))
+        dates.append(forfb_date)
+    collect_pages(pages, dates)
+    if export:
+        export_to_googlesheet(page_id, dates)
+
+def backfill(start, end, export=True):
+    """
+        Reload the data of an arbitrary month range, e.g. backfill('2019-01', '2023-12').
+        The months of all pages are fetched with concurrent Graph API batch requests into the local store,
+        then the main page is exported to Google Sheets once per year.
+    """
+    dates = month_range(start, end)
+    logger.info('Backfill %d months', len(dates))
+    collect_pages(pages, dates)
+    if export:
+        export_to_googlesheet(page_id, dates)
+    
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Collect the monthly insights of your Facebook fan pages and export them to Google Sheets.')
+    parser.add_argument('command', nargs='?', default='monthly', choices=['monthly', 'backfill'],
+                        help='monthly: the months from rnge_std to rnge_end (default: last month), backfill: reload a month range')
+    parser.add_argument('months', nargs='*', metavar='month', help='backfill: the first and the last month, e.g. 2019-01 2023-12')
+    parser.add_argument('--no-export', action='store_true', help='only collect into the local store, do not export to Google Sheets')
+    cli.add_run_arguments(parser, run_metrics_file)
+    args = parser.parse_args(argv)
+    if len(args.months) != (2 if args.command == 'backfill' else 0):
+        parser.error('backfill needs the first and the last month, monthly takes no months')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger.info('Start')
+    cli.start_run(args)
+    if args.command == 'backfill':
+        backfill(*args.months, export=not args.no_export)
+    else:
+        main_monthly_loop(export=not args.no_export)
+    cli.finish_run(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,101 +1,532 @@
-"""
-This script automates the process of retrieving permissions from multiple Google Sheets at once. 
-By looping through the list of Google Sheets, it ensures that each sheet's access permissions are granted appropriately, making the process more efficient and scalable.
-
-Prerequisites:  
-- Google Cloud credentials with access to the Google Drive API.  
-
-Note:  
-- Although this script works with Google Sheets, it specifically requires the Google Drive API instead of the Google Sheets API to retrieve permissions.  
-"""
-
-
-import httplib2
-import pandas as pd
-import os
-import auth
-from googleapiclient import discovery
-from oauth2client.file import Storage
-
-# Set the file location and name for saving outputs
-save_dir = r'C:\Users\Vivian\Desktop' # file location
-filename = 'GoogleSheet權限管理' # file name
-
-# Set multiple Google Sheets
-fileinfo = [ 
-    # your googlesheet names and ids
-    {'file': 'googlesheetname', 'id': 'googlesheetid', 'filename': f'{filename}_1'}, 
-    {'file': 'googlesheetname', 'id': 'googlesheetid', 'filename': f'{filename}_2'}
-]
-
-# Set up Google Cloud credentials and Google Drive API
-SCOPES = 'https://www.googleapis.com/auth/drive'
-CLIENT_SECRET_FILE = 'client_secret.json'
-APPLICATION_NAME = 'gcp_project_name' #your gcp project name
-authInst = auth.auth(SCOPES,CLIENT_SECRET_FILE,APPLICATION_NAME)
-credentials = authInst.getCredentials()
-http = credentials.authorize(httplib2.Http())
-drive_service = discovery.build('drive', 'v3', http=http)
-
-# Prepare a function to save data to an Excel file
-def fuct_to_csv(df, fn):
-    df.to_csv(fn, sep='\t', encoding='utf_8_sig', date_format='string',
-              index=False, chunksize=10**5)
-def fuct_to_excel(df, fn):
-    df.to_excel(fn, sheet_name='data', encoding='utf_8_sig',
-                index=False)
-
-class file_obj:
-    """
-    - Managing credentials for API access.
-    - Retrieving all permissions for a file (display name, email, and role).
-    - Exporting the permissions data to an Excel file.
-    """
-    def __init__(self, fileinfo):
-        self.fileid = fileinfo.get('id', '')
-        self.file = fileinfo.get('file', '')
-        self.filename = fileinfo.get('filename', '')
-    
-    def get_credentials(self):
-        home_dir = os.path.expanduser('~')
-        credential_dir = os.path.join(home_dir, '.credentials')
-        if not os.path.exists(credential_dir):
-            os.makedirs(credential_dir)
-        credential_path = os.path.join(credential_dir,
-                                       'drive-python-quickstart.json')
-    
-        store = Storage(credential_path)
-        credentials = store.get()
-        if not credentials or credentials.invalid:
-            if credentials and credentials.expired and credentials.refresh_token:
-                credentials.refresh()
-            else:
-                pass
-        return credentials
-        
-    def get_permissions(self): 
-        """Return all permissions for a file.
-        # Get user name, email, and permission role
-        """
-        perm_request = drive_service.permissions().list(fileId = self.fileid,
-                                                        fields = "permissions(displayName,emailAddress,role)").execute()
-        permission = perm_request.get('permissions', [])
-        
-        df = pd.DataFrame(permission)
-        return df
-    
-    def to_excel(self):
-        df = self.get_permissions()
-        df['filename'] = self.file
-        fuct_to_excel(df ,self.filename + '.xlsx')
-        
-def loop_fileinfo(fileinfo):
-    """Loop through multiple Google Sheets."""
-    os.chdir(save_dir)
-    for file in fileinfo:
-        obj = file_obj(file)
-        obj.to_excel()
-        print('finish : ', file['file'])
-
-if __name__ == '__main__':
-    loop_fileinfo(fileinfo)
+"""
+This script automates the process of retrieving permissions from multiple Google Sheets at once. 
+By looping through the list of Google Sheets, it ensures that each sheet's access permissions are granted appropriately, making the process more efficient and scalable.
+
+Prerequisites:  
+- Google Cloud credentials with access to the Google Drive API.  
+
+Note:  
+- Although this script works with Google Sheets, it specifically requires the Google Drive API instead of the Google Sheets API to retrieve permissions.  
+
+Usage:
+    python Google_Sheets_permissions.py [--output csv] [--folder FOLDER_ID | --shared-drive DRIVE_ID] [--track-changes]
+                                        [--metrics run_metrics.json] [--no-cache]
+"""
+
+
+import os
+import json
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_utils import cli, files, http_client, metrics, pipeline, response_cache
+from api_utils.lazy import lazy_import
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Set the file location and name for saving outputs
+save_dir = r'C:\Users\Vivian\Desktop' # file location
+filename = 'GoogleSheet權限管理' # file name
+metrics_filename = 'run_metrics.json' # latency per endpoint, stage timings and slowest files of the run ('.prom' for Prometheus text), None to skip
+output_mode = 'excel' # 'excel': one workbook per Google Sheet, 'csv' / 'parquet' / 'xlsx': one consolidated report for all Google Sheets
+report_columns = ['fileid', 'filename', 'displayName', 'emailAddress', 'role']
+
+# Set multiple Google Sheets
+fileinfo = [ 
+    # your googlesheet names and ids
+    {'file': 'googlesheetname', 'id': 'googlesheetid', 'filename': f'{filename}_1'}, 
+    {'file': 'googlesheetname', 'id': 'googlesheetid', 'filename': f'{filename}_2'}
+]
+# Or audit every Google Sheet under a folder (including subfolders) or in a shared drive, instead of the list above
+folder_id = None       # your google drive folder id
+shared_drive_id = None # your shared drive id
+# Or only re-check the Google Sheets changed since the last run, and save the granted / revoked permissions
+track_changes = False
+state_file = 'permissions_state.json' # Drive changes page token and permission snapshot, saved in save_dir
+
+# Set up Google Cloud credentials and Google Drive API
+SCOPES = 'https://www.googleapis.com/auth/drive'
+CLIENT_SECRET_FILE = 'client_secret.json'
+APPLICATION_NAME = 'gcp_project_name' #your gcp project name
+drive_service = None # built on first use, see get_drive_service()
+discovery_file = os.path.join(os.path.expanduser('~'), '.cache', 'drive_v3_discovery.json') # the API description, saved on the first run
+discovery_url = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+
+# Set up the permission scanner
+batch_limit = 100 # permissions().list calls sent in one batch HTTP request (the Drive API allows up to 100)
+rate_limiter = None # an api_utils.rate_limit.RateLimiter for the batch requests (e.g. the budget of run_collectors), None = no limit
+permission_fields = "nextPageToken,permissions(displayName,emailAddress,role)"
+permission_page_size = 100 # the Drive API allows up to 100 permissions per page
+files_page_size = 1000     # the Drive API allows up to 1000 files per page
+change_fields = "nextPageToken,newStartPageToken,changes(fileId,removed,file(name,mimeType,trashed))"
+folder_query_size = 20     # folders listed in one files().list query
+permissions_cache_ttl = 3600 # seconds the permissions of a file are served from the local response cache (api_utils.response_cache), 0 = always fetched
+permissions_endpoint = r'/files/[^/]+/permissions$' # URL path of permissions().list, the only cached Drive call
+rate_limit_reasons = {'rateLimitExceeded', 'userRateLimitExceeded'} # the 403 errors which are retried
+spreadsheet_mime = 'application/vnd.google-apps.spreadsheet'
+folder_mime = 'application/vnd.google-apps.folder'
+
+def discovery_document():
+    """
+        Return the Drive v3 discovery document (the description of the API which the client is built from).
+        It is saved to `discovery_file` on the first run and read from there afterwards, so the client is built
+        without downloading it. The first run takes the copy shipped with googleapiclient 2.x when there is one.
+    """
+    if os.path.exists(discovery_file):
+        with open(discovery_file, encoding='utf-8') as f:
+            return f.read()
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc('drive', 'v3')
+    except ImportError:
+        document = None
+    if document is None:
+        response = http_client.request('GET', discovery_url)
+        response.raise_for_status()
+        document = response.text
+    os.makedirs(os.path.dirname(discovery_file), exist_ok=True)
+    files.write_text(discovery_file, document)
+    return document
+
+def get_drive_service():
+    """
+        Return the Google Drive API client, it is authorized and built on the first call and reused afterwards.
+        Another client (e.g. pointing to a local test server) can be used by assigning it to `drive_service`.
+    """
+    global drive_service
+    if drive_service is None:
+        from googleapiclient import discovery
+        import auth
+        authInst = auth.auth(SCOPES,CLIENT_SECRET_FILE,APPLICATION_NAME)
+        credentials = authInst.getCredentials()
+        http = credentials.authorize(http_client.build_http(cache_ttls={permissions_endpoint: permissions_cache_ttl},
+                                                            cache_account=CLIENT_SECRET_FILE)) # keeps the connection alive between files
+        drive_service = discovery.build_from_document(discovery_document(), http=http)
+    return drive_service
+
+# Prepare a function to save data to an Excel file
+def fuct_to_csv(df, fn):
+    df.to_csv(fn, sep='\t', encoding='utf_8_sig', date_format='string',
+              index=False, chunksize=10**5)
+def fuct_to_excel(df, fn):
+    df.to_excel(fn, sheet_name='data', index=False)
+
+class file_obj:
+    """
+    - Managing credentials for API access.
+    - Retrieving all permissions for a file (display name, email, and role).
+    - Exporting the permissions data to an Excel file.
+    """
+    def __init__(self, fileinfo):
+        self.fileid = fileinfo.get('id', '')
+        self.file = fileinfo.get('file', '')
+        self.filename = fileinfo.get('filename', '')
+    
+    def get_credentials(self):
+        from oauth2client.file import Storage
+        home_dir = os.path.expanduser('~')
+        credential_dir = os.path.join(home_dir, '.credentials')
+        if not os.path.exists(credential_dir):
+            os.makedirs(credential_dir)
+        credential_path = os.path.join(credential_dir,
+                                       'drive-python-quickstart.json')
+    
+        store = Storage(credential_path)
+        credentials = store.get()
+        if not credentials or credentials.invalid:
+            if credentials and credentials.expired and credentials.refresh_token:
+                credentials.refresh()
+            else:
+                pass
+        return credentials
+        
+    def get_permissions(self): 
+        """Return all permissions for a file.
+        # Get user name, email, and permission role
+        # Loops through all pages of permissions using the next page token
+        """
+        permission = []
+        pagetoken = None
+        while True:
+            perm_request = get_drive_service().permissions().list(fileId = self.fileid,
+                                                                  fields = permission_fields,
+                                                                  pageSize = permission_page_size,
+                                                                  pageToken = pagetoken,
+                                                                  supportsAllDrives = True).execute(num_retries=http_client.max_retries)
+            permission.extend(perm_request.get('permissions', []))
+            pagetoken = perm_request.get('nextPageToken')
+            if pagetoken is None:
+                break
+        
+        df = pd.DataFrame(permission)
+        return df
+    
+    def to_excel(self, df=None):
+        """Export the permissions, ``df`` is the result of `scan_permissions()` if the permissions are already fetched."""
+        if df is None:
+            df = self.get_permissions()
+        df['filename'] = self.file
+        fuct_to_excel(df ,self.filename + '.xlsx')
+
+def is_retryable(exception):
+    """
+        Return True for the rate limit and server errors of a batch call, which are retried.
+        A 403 is only retried for a rate limit reason, not e.g. for insufficientFilePermissions.
+    """
+    from googleapiclient.errors import HttpError
+    if not isinstance(exception, HttpError):
+        return False
+    if exception.resp.status == 403:
+        details = exception.error_details if isinstance(exception.error_details, list) else []
+        return any(isinstance(detail, dict) and detail.get('reason') in rate_limit_reasons for detail in details)
+    return exception.resp.status in {429, 500, 502, 503, 504}
+
+def scan_permissions(fileinfo, failed=None, use_cache=True):
+    """
+        Return the permissions of many files at once, as a list of DataFrames in the same order as ``fileinfo``.
+        Up to `batch_limit` permissions().list calls are sent in one HTTP round-trip with googleapiclient BatchHttpRequest.
+        - Files with more permission pages are requested again in the next batch with their next page token.
+        - Calls failed by a rate limit or server error are sent again in the next batch, with exponential backoff.
+        - Files which still failed are returned as empty DataFrames, their errors are put in the ``failed`` dict by index.
+        - Pages still fresh in the response cache are not requested (``use_cache=False`` always requests them),
+          the requested pages are stored in the cache for `permissions_cache_ttl` seconds.
+    """
+    permissions = {index: [] for index in range(len(fileinfo))}
+    retries = {index: 0 for index in range(len(fileinfo))}
+    failed = {} if failed is None else failed
+    service = get_drive_service()
+    pending = [(index, None) for index in range(len(fileinfo))]
+    
+    while len(pending) > 0:
+        next_pending = []
+        tokens = dict(pending)
+        backoff = [0] # highest retry count of this round
+        cache_keys = {} # request_id -> (cache key, URL) of the calls sent in a batch
+        
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                if request_id in cache_keys:
+                    cache_key, uri = cache_keys.pop(request_id)
+                    response_cache.put(cache_key, uri, 200, {'Content-Type': 'application/json'},
+                                       json.dumps(response).encode(), permissions_cache_ttl)
+                permissions[index].extend(response.get('permissions', []))
+                if response.get('nextPageToken') is not None:
+                    next_pending.append((index, response['nextPageToken']))
+            elif is_retryable(exception) and retries[index] < http_client.max_retries:
+                if exception.resp.status in {403, 429}:
+                    metrics.count('quota_hits')
+                retries[index] += 1
+                backoff[0] = max(backoff[0], retries[index])
+                next_pending.append((index, tokens[index]))
+            else:
+                failed[index] = exception
+        
+        for i in range(0, len(pending), batch_limit):
+            batch = service.new_batch_http_request(callback=callback)
+            sent = 0
+            for index, pagetoken in pending[i:i + batch_limit]:
+                perm_request = service.permissions().list(fileId=fileinfo[index]['id'], fields=permission_fields,
+                                                          pageSize=permission_page_size, pageToken=pagetoken,
+                                                          supportsAllDrives=True)
+                if permissions_cache_ttl > 0 and response_cache.enabled:
+                    # the same key as the permissions().list calls of get_permissions(), see get_drive_service()
+                    cache_key = response_cache.key('GET', perm_request.uri, account=CLIENT_SECRET_FILE)
+                    entry = response_cache.get(cache_key) if use_cache else None
+                    if entry is not None and entry['fresh']:
+                        metrics.count('cache_hits')
+                        callback(str(index), json.loads(entry['content']), None)
+                        continue
+                    metrics.count('cache_misses')
+                    cache_keys[str(index)] = (cache_key, perm_request.uri)
+                batch.add(perm_request, request_id=str(index))
+                sent += 1
+            if sent > 0:
+                if rate_limiter is not None:
+                    rate_limiter.acquire(sent) # every request of the batch counts against the quota
+                with metrics.stage('fetch'):
+                    batch.execute()
+        
+        if backoff[0] > 0:
+            time.sleep(http_client.backoff_factor * 2 ** (backoff[0] - 1) + random.uniform(0, 1))
+        pending = next_pending
+    
+    for index, exception in failed.items():
+        logger.error('failed : %s %s', fileinfo[index]['file'], exception)
+    with metrics.stage('transform'):
+        return [pd.DataFrame(permissions[index]) for index in range(len(fileinfo))]
+
+def list_files(query, **kwargs):
+    """Return all files of a files().list query, only the id, name and mimeType fields are requested."""
+    items = []
+    pagetoken = None
+    while True:
+        response = get_drive_service().files().list(q=query, fields='nextPageToken,files(id,name,mimeType)',
+                                                    pageSize=files_page_size, pageToken=pagetoken,
+                                                    supportsAllDrives=True, includeItemsFromAllDrives=True,
+                                                    **kwargs).execute(num_retries=http_client.max_retries)
+        items.extend(response.get('files', []))
+        pagetoken = response.get('nextPageToken')
+        if pagetoken is None:
+            return items
+
+def list_spreadsheets(folder_id=None, drive_id=None):
+    """
+        Return the `fileinfo` list of every Google Sheet under a folder (including its subfolders) or in a shared drive,
+        to be used by `loop_fileinfo()` instead of typing every file id.
+        The subfolders are listed level by level, `folder_query_size` folders in one query.
+    """
+    sheets = []
+    if drive_id is not None:
+        sheets = list_files(f"mimeType='{spreadsheet_mime}' and trashed=false", corpora='drive', driveId=drive_id)
+    else:
+        folders = [folder_id]
+        while len(folders) > 0:
+            subfolders = []
+            for i in range(0, len(folders), folder_query_size):
+                parents = ' or '.join(f"'{folder}' in parents" for folder in folders[i:i + folder_query_size])
+                children = list_files(f"({parents}) and (mimeType='{spreadsheet_mime}' or mimeType='{folder_mime}') and trashed=false")
+                sheets.extend(file for file in children if file['mimeType'] == spreadsheet_mime)
+                subfolders.extend(file['id'] for file in children if file['mimeType'] == folder_mime)
+            folders = subfolders
+    
+    logger.info('found %d Google Sheets', len(sheets))
+    return [{'file': sheet['name'], 'id': sheet['id'], 'filename': f'{filename}_{i + 1}'} for i, sheet in enumerate(sheets)]
+        
+class PermissionReport:
+    """
+    Streams the permissions of all Google Sheets into one consolidated report, file by file,
+    so the write time and memory stay low for a large number of permission rows.
+    
+    - ``fmt='csv'``: one tab-separated file in the same format as `fuct_to_csv()`, the header is written once.
+    - ``fmt='parquet'``: one Parquet file, each Google Sheet is written as a row group with pyarrow's ParquetWriter.
+    - ``fmt='xlsx'``: one workbook with xlsxwriter in constant-memory mode (openpyxl write-only mode if xlsxwriter is not installed).
+    - `write()`: Appends the permissions of one Google Sheet. `close()`: Finishes the report.
+    """
+    def __init__(self, fmt='csv'):
+        self.fmt = fmt
+        self.fn = f'{filename}.{"csv" if fmt == "csv" else fmt}'
+        self.rows = 0
+        self.header_written = False # the first Google Sheets can have no rows, e.g. a failed scan
+        if fmt == 'csv':
+            if os.path.exists(self.fn):
+                os.remove(self.fn)
+        elif fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.schema = pa.schema([(col, pa.string()) for col in report_columns])
+            self.writer = pq.ParquetWriter(self.fn, self.schema)
+        elif fmt == 'xlsx':
+            try:
+                import xlsxwriter
+                self.workbook = xlsxwriter.Workbook(self.fn, {'constant_memory': True})
+                self.worksheet = self.workbook.add_worksheet('data')
+                self.append_row = lambda row: self.worksheet.write_row(self.rows, 0, row)
+            except ImportError:
+                from openpyxl import Workbook
+                self.workbook = Workbook(write_only=True)
+                self.worksheet = self.workbook.create_sheet('data')
+                self.append_row = self.worksheet.append
+            self.append_row(report_columns)
+        else:
+            raise ValueError(f'unknown output format: {fmt}')
+    
+    def write(self, df):
+        df = df.reindex(columns=report_columns).fillna('').astype(str)
+        if self.fmt == 'csv':
+            df.to_csv(self.fn, sep='\t', encoding='utf_8_sig', date_format='string',
+                      index=False, mode='a', header=not self.header_written)
+            self.header_written = True
+        elif self.fmt == 'parquet':
+            import pyarrow as pa
+            self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        else:
+            for row in df.itertuples(index=False):
+                self.rows += 1
+                self.append_row(list(row))
+            return
+        self.rows += len(df)
+    
+    def close(self):
+        if self.fmt == 'parquet':
+            self.writer.close()
+        elif self.fmt == 'xlsx':
+            if hasattr(self.workbook, 'save'):
+                self.workbook.save(self.fn)
+            else:
+                self.workbook.close()
+        logger.info('%d permissions saved to %s', self.rows, self.fn)
+
+def loop_fileinfo(fileinfo, output=None):
+    """
+        Loop through multiple Google Sheets, the permissions are fetched in batches with `scan_permissions()`.
+        ``output='excel'`` writes one workbook per Google Sheet, the other modes write one `PermissionReport`,
+        None uses `output_mode`.
+        The batches go through `pipeline.run()`, the next batch is fetched while the permissions of the last one are written.
+        One batch is fetched at a time, the Drive client (httplib2) is not thread-safe.
+    """
+    output = output_mode if output is None else output
+    os.chdir(save_dir)
+    report = None if output == 'excel' else PermissionReport(output)
+    
+    def sink(batch, permissions):
+        for file, df in zip(batch, permissions):
+            with metrics.stage('write', key=file['file']):
+                if report is None:
+                    file_obj(file).to_excel(df)
+                else:
+                    df['fileid'] = file['id']
+                    df['filename'] = file['file']
+                    report.write(df)
+            logger.debug('finish : %s', file['file'])
+    
+    # one batch request of files at a time, so only the permissions of a few batches are kept in memory
+    chunks = [fileinfo[i:i + batch_limit] for i in range(0, len(fileinfo), batch_limit)]
+    pipeline.run(chunks, scan_permissions, sink=sink)
+    if report is not None:
+        report.close()
+
+def load_state():
+    """Return the saved page token and permission snapshot of `audit_changes()`, None before the first run."""
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state):
+    files.write_json(state_file, state)
+
+def get_start_page_token(drive_id=None):
+    """Return the Drive changes page token of now, ``drive_id`` for the changes of a shared drive."""
+    kwargs = {} if drive_id is None else {'driveId': drive_id, 'supportsAllDrives': True}
+    response = get_drive_service().changes().getStartPageToken(**kwargs).execute(num_retries=http_client.max_retries)
+    return response['startPageToken']
+
+def list_changes(pagetoken, drive_id=None):
+    """Return all changes since the page token and the page token for the next run."""
+    kwargs = {} if drive_id is None else {'driveId': drive_id}
+    changes = []
+    while True:
+        response = get_drive_service().changes().list(pageToken=pagetoken, fields=change_fields,
+                                                      pageSize=files_page_size, includeRemoved=True,
+                                                      supportsAllDrives=True, includeItemsFromAllDrives=True,
+                                                      **kwargs).execute(num_retries=http_client.max_retries)
+        changes.extend(response.get('changes', []))
+        if 'newStartPageToken' in response:
+            return changes, response['newStartPageToken']
+        pagetoken = response['nextPageToken']
+
+def permission_rows(df):
+    """Return the permissions of a file as sorted [displayName, emailAddress, role] rows, as saved in the snapshot."""
+    df = df.reindex(columns=['displayName', 'emailAddress', 'role']).fillna('').astype(str)
+    return sorted(df.values.tolist())
+
+def permission_diff(fileid, file, old, new):
+    """Return the granted and revoked permissions of a file, a changed role is a revoked and a granted permission."""
+    old, new = set(map(tuple, old)), set(map(tuple, new))
+    changes = [('granted', row) for row in sorted(new - old)] + [('revoked', row) for row in sorted(old - new)]
+    return [[fileid, file, change, *row] for change, row in changes]
+
+def audit_changes(fileinfo, drive_id=None, folder=None):
+    """
+        Re-check only the permissions of the Google Sheets changed since the last run, with the Drive changes API,
+        and save the granted / revoked permissions against the snapshot of the last run to ``{filename}_changes.csv``.
+        - The first run saves the page token and scans the permissions of all Google Sheets in ``fileinfo`` as the snapshot.
+        - The Google Sheets of the snapshot and ``fileinfo`` are audited, with ``drive_id`` also the new ones in the shared drive.
+        - ``folder`` / ``drive_id`` replace ``fileinfo`` and are saved in the state, later runs use them without being given again:
+          the folder is listed on every run (so the Google Sheets created in it are audited), the shared drive on the first run.
+        - Removed or trashed Google Sheets are reported as revoked, failed scans are checked again in the next run.
+    """
+    os.chdir(save_dir)
+    state = load_state()
+    first_run = state is None
+    folder = folder if folder is not None or first_run else state.get('folder')
+    drive_id = drive_id if drive_id is not None or first_run else state.get('driveId')
+    if folder is not None:
+        fileinfo = list_spreadsheets(folder)
+    elif drive_id is not None:
+        # the new Google Sheets of the shared drive are found in the changes
+        fileinfo = list_spreadsheets(drive_id=drive_id) if first_run else []
+    if first_run:
+        # take the page token before the scan, so no change made during the scan is missed
+        state = {'pageToken': get_start_page_token(drive_id), 'files': {}, 'pending': [], 'removed': []}
+        changed = {file['id']: file['file'] for file in fileinfo}
+        removed = set()
+    else:
+        tracked = {fileid: item['file'] for fileid, item in state['files'].items()}
+        tracked.update({file['id']: file['file'] for file in fileinfo})
+        changes, state['pageToken'] = list_changes(state['pageToken'], drive_id)
+        changed = {fileid: tracked[fileid] for fileid in state['pending'] if fileid in tracked}
+        removed = set()
+        for change in changes:
+            fileid, item = change.get('fileId'), change.get('file', {})
+            if fileid not in tracked and not (drive_id is not None and item.get('mimeType') == spreadsheet_mime):
+                continue
+            if change.get('removed') or item.get('trashed'):
+                removed.add(fileid)
+                changed.pop(fileid, None)
+            else:
+                removed.discard(fileid) # restored from the trash
+                changed[fileid] = item.get('name', tracked.get(fileid, ''))
+        # files added to fileinfo since the last run
+        changed.update({fileid: file for fileid, file in tracked.items()
+                        if fileid not in state['files'] and fileid not in removed and fileid not in state['removed']})
+        state['removed'] = sorted((set(state['removed']) - set(changed)) | removed)
+    logger.info('%d changed, %d removed Google Sheets', len(changed), len(removed))
+    
+    rows = []
+    for fileid in removed:
+        item = state['files'].pop(fileid, None)
+        if item is not None:
+            rows.extend(permission_diff(fileid, item['file'], item['permissions'], []))
+    changed_files = [{'id': fileid, 'file': file} for fileid, file in changed.items()]
+    failed = {}
+    permissions = scan_permissions(changed_files, failed, use_cache=False) # a changed file may have changed permissions
+    state['pending'] = [changed_files[index]['id'] for index in failed]
+    for index, (file, df) in enumerate(zip(changed_files, permissions)):
+        if index in failed:
+            continue
+        new = permission_rows(df)
+        if not first_run:
+            old = state['files'].get(file['id'], {}).get('permissions', [])
+            rows.extend(permission_diff(file['id'], file['file'], old, new))
+        state['files'][file['id']] = {'file': file['file'], 'permissions': new}
+    state['folder'], state['driveId'] = folder, drive_id
+    save_state(state)
+    
+    diff = pd.DataFrame(rows, columns=['fileid', 'filename', 'change', 'displayName', 'emailAddress', 'role'])
+    fuct_to_csv(diff, f'{filename}_changes.csv')
+    logger.info('%d permission changes saved to %s_changes.csv', len(diff), filename)
+    return diff
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Save the permissions of many Google Sheets.')
+    parser.add_argument('--output', choices=['csv', 'parquet', 'xlsx', 'excel'], default=output_mode,
+                        help='csv / parquet / xlsx: one report for all Google Sheets, excel: one workbook per Google Sheet')
+    parser.add_argument('--folder', default=folder_id, help='audit every Google Sheet under this folder, instead of fileinfo')
+    parser.add_argument('--shared-drive', default=shared_drive_id, help='audit every Google Sheet in this shared drive')
+    parser.add_argument('--track-changes', action='store_true', default=track_changes,
+                        help='only re-check the Google Sheets changed since the last run and save the granted / revoked permissions')
+    cli.add_run_arguments(parser, metrics_filename)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    cli.start_run(args)
+    sheets = fileinfo
+    if args.track_changes:
+        audit_changes(sheets, args.shared_drive, args.folder)
+    else:
+        if args.folder is not None or args.shared_drive is not None:
+            sheets = list_spreadsheets(args.folder, args.shared_drive)
+        loop_fileinfo(sheets, output=args.output)
+    cli.finish_run(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,379 +1,846 @@
-"""
-This script automates the retrieval of location details and names from your Google Maps account. 
-It also fetches reviews and associated replies for each location, enabling streamlined analysis and management of customer feedback.
-
-- Connects to the Google Maps API to retrieve business location information.
-- Extracts customer reviews and their corresponding replies for better insights.
-- Supports scalable data collection for multiple business locations.
-- Provides a foundation for sentiment analysis, review trend tracking, or customer satisfaction evaluation.
-"""
-
-
-import pandas as pd
-import dask.dataframe as dd
-import requests
-import os
-import glob
-import math
-import json
-import time
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-
-# Set the file location and file name for saving
-config_dir = r'C:\Users\Vivian\Desktop\config_data'
-save_dir = r'C:\Users\Vivian\Desktop'
-location_list_filename = 'locations.csv'
-review_summ_filename = 'reviews_summ.csv'
-review_detail_filename = 'reviews_detail.csv'
-
-# Set up Google Maps credentials and token
-refresh_token_file = r'\GoogleBusinessApi_refresh.txt'
-access_token_file = r'\GoogleBusinessApi_access.txt'
-account_details = './account.json'
-gcp_client = './client_secrets.json'
-
-# Set up Google Maps API url path
-refresh_token_url = 'https://accounts.google.com/o/oauth2/token'
-accounts_api = 'https://mybusinessaccountmanagement.googleapis.com/v1/accounts'
-locations_api = 'https://mybusinessbusinessinformation.googleapis.com/v1/account/locations'
-reviews_api = 'https://mybusiness.googleapis.com/v4/account/location/reviews'
-locations_api_bat = 'https://mybusiness.googleapis.com/v4/account/locations:batchGetReviews'
-
-def read_config(config_file: str):
-    with open(config_file, 'r', encoding='utf-8') as file:
-        data = json.load(file, strict = False)
-        return data
-
-def fuct_to_csv(df, fn):
-    """Save file to excel"""
-    df.to_csv(fn, sep='\t', encoding='utf_8_sig', date_format='string',
-              index=False, chunksize=10**5)
-
-def rsp_getnextpagecnt(report):
-    """If there are multiple pages of data, retrieve the next page using the provided next page token."""
-    try:
-        nextpagecnt = report.get('nextPageToken')
-        # print(f'skip {nextpagecnt}')
-        return nextpagecnt
-    except Exception as e:
-        print(e)
-        return ""
-
-def sleep(i):
-    """Set the sleep time to control the rate of requests sent to the API."""
-    if i % 30 == 0:
-        print('sleep for 10s')
-        time.sleep(10)
-
-# for read and refresh token if necessary
-class Token:
-    """
-        The class consolidates all functions related to token management, including reading, refreshing API.
-        ''refresh_token'' Refresh authentication tokens if necessary.
-    """
-    def __init__(self):
-        self.config_gcp = read_config(gcp_client)
-        self.config = self.config_gcp.get('web')
-        self.clientid = self.config.get('client_id')
-        self.clientsecret = self.config.get('client_secret')
-
-    def read_refresh_token(self):
-        token_file = open(config_dir + refresh_token_file, "r")
-        token = token_file.read()
-        return token
-    
-    def refresh_token(self):
-        refresh_token = self.read_refresh_token()
-        payload = {
-            'client_id' : f'{self.clientid}',
-            'client_secret' : f'{self.clientsecret}',
-            'grant_type' : 'refresh_token',
-            'redirect_uri' : 'https%3A%2F%2Fdevelopers.google.com%2Foauthplayground',
-            'access_type' : 'offline',
-            'approval_prompt' : 'force',
-            'refresh_token' : f'{refresh_token}'
-            }
-        
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-    
-        response = requests.request("POST", refresh_token_url, headers=headers, data=payload).text
-        # print(response)
-        refresh_token = json.loads(response).get('access_token')
-        with open(config_dir + access_token_file, 'w') as f:
-            f.write(refresh_token)
-    
-    def read_access_token(self):
-        token_file = open(config_dir + access_token_file, "r")
-        token = token_file.read()
-        return token
-
-class Locations:
-    """
-        The class is designed to retrieve and process location data from a Google account.
-        
-        - `locations_API()`: Fetches location data from the API by making a request using the account’s access token.
-        - `trans_location_df()`: Transforms the API response into a structured DataFrame by extracting and formatting the address information. It also appends the account name and prepares the final DataFrame for use.
-        - `get_locationsid()`: Calls the API to fetch all locations, handles pagination, and processes the data into a DataFrame, which is then transformed into a readable format using `trans_location_df()`.
-    """
-    def __init__(self, account):
-        self.location_list = []
-        self.account = account
-    
-    def locations_API(self, pagetoken):
-        url = locations_api.replace('account', self.account)
-        access_token = Token().read_access_token()
-        payload = {
-            'pageToken' : pagetoken,
-            'pageSize' : 100,
-            'orderBy' : 'storeCode desc',
-            'read_mask' : 'name,title,storeCode,storefront_address'
-            }
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        response = requests.request("GET", url, headers=headers, params=payload).text
-        print(response)
-        df = json.loads(response)
-        return df
-    
-    def trans_location_df(self, df):
-        df = pd.concat([df, df['storefrontAddress'].apply(pd.Series)], axis=1)
-        df = pd.concat([df, pd.DataFrame(df['addressLines'].apply(pd.Series)).rename(columns=lambda x: "storeaddress"+str(x))], axis=1)
-        df = df.fillna("")
-        sel_col = [col for col in df.columns if 'storeaddress' in col]
-        df['addressLine'] = df[sel_col].apply(lambda x: ' '.join(x), axis=1)
-        df['address'] = df[['administrativeArea', 'locality', 'addressLine']].apply(lambda x: ''.join(x), axis=1)
-        df['account'] = self.account
-        rst_df = df[["account", "name", "storeCode", "title", "postalCode", "address"]]
-        return rst_df
-    
-    def get_locationsid(self):
-        data = self.locations_API(None)
-        location_ids = data.get('locations')
-        ids_df = pd.DataFrame.from_dict(location_ids)
-        pagetoken = rsp_getnextpagecnt(data)
-        self.location_list.append(ids_df)
-        
-        while pagetoken != None:
-            resp = self.locations_API(pagetoken)
-            location_ids = resp.get('locations')
-            ids_df = pd.DataFrame.from_dict(location_ids)
-            pagetoken = rsp_getnextpagecnt(resp)
-            self.location_list.append(ids_df)
-    
-        rst_df = pd.DataFrame()
-        try:
-            if len(self.location_list) > 0:
-                rst_df = pd.concat(self.location_list)
-    
-        except Exception as e:
-            print(e)
-        
-        rst_df = self.trans_location_df(rst_df)
-        return rst_df
-        
-    def locations_tocsv(self):
-        rst_df = self.get_locationsid()
-        fuct_to_csv(rst_df, location_list_filename)
-
-    def read_locationsid():
-        df = pd.read_csv(f'{location_list_filename}', sep='\t')
-        return df
- 
-class Reviews_bat:
-    """The class retrieves ratings and review data for a list of locations from the 'Locations' class."""
-    
-    def __init__(self, locations_list, account):
-        self.location_id = locations_list
-        self.account = account
-
-    def reviews_bat_API(self, pagetoken):
-        url = locations_api_bat.replace('account', self.account)
-        
-        access_token = Token().read_access_token()
-        payload = {         
-            "locationNames": 
-              [self.location_id]
-            ,
-            "pageSize": 50,
-            "pageToken": pagetoken
-            }
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        response = requests.request("POST", url, headers=headers, data=payload).text
-        print(response)
-        df = json.loads(response)
-        return df
-
-class Reviews:
-    """
-    The class retrieves reviews detail, including reviewer names and comments for a specific location.
-    
-    - `reviews_API()`: Sends a request to the API to fetch reviews data for the location. Handles pagination using `pagetoken`.
-    - `get_reviews_detailall()`: Processes detailed review data, including reviewer names, comments and ratings.
-    - `get_reviews_summ()`: Extracts and processes the summary information from the reviews data.
-    - `reviews_page_loop()`: Loops through all available pages of reviews and consolidates the details and summary into two DataFrames.
-    - `refreshtoken_again()`: Attempts to refresh the access token and retries fetching reviews in case of an error.
-    """
-    def __init__(self, location_id):
-        self.review_summ_list = []
-        self.review_detail = []
-        self.account = location_id['account']
-        self.id = location_id['name']
-        self.shopid = location_id['storeCode']
-
-    def reviews_API(self, pagetoken):
-        url = reviews_api.replace('account', self.account).replace('location', self.id)
-        
-        access_token = Token().read_access_token()
-        payload = {
-            'pageToken' : pagetoken,
-            'pageSize' : 50
-            }
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        response = requests.request("GET", url, headers=headers, params=payload).text
-        # print(response)
-        df = json.loads(response)
-        return df
-    
-    def get_reviews_detailall(self, reviews):
-        df = reviews.get('reviews')
-        if df is None:
-            df = []
-        for r_list in df:
-            sel_column = {x: r_list[x] for x in r_list if x not in {'reviewer', 'name', 'reviewReply'}}
-            df = pd.DataFrame([sel_column])
-            self.review_detail.append(df)
-            rst_df = pd.DataFrame()
-        rst_df = pd.concat(self.review_detail, ignore_index=1)
-        rst_df = rst_df.replace(r'\n',' ', regex=True) 
-        rst_df['storeCode'] = self.shopid
-        return rst_df
-        
-    def get_reviews_summ(self, data):
-        js = data
-        sel_column = {x: js[x] for x in js if x not in {"reviews", "nextPageToken"}}
-        for k, v in sel_column.items():
-            pass
-        df = pd.DataFrame(sel_column.items()).set_index(0).T
-        df['storeCode'] = self.shopid
-        return df
-        
-    def reviews_page_loop(self):
-        print(f'start {self.shopid}')
-        data = self.reviews_API(None)
-
-        if len(data) > 0:
-            reviews = self.get_reviews_detailall(data)
-            reviews_summ_df = self.get_reviews_summ(data)
-            pagetoken = rsp_getnextpagecnt(data)
-            
-            while pagetoken != None:
-                resp = self.reviews_API(pagetoken)
-                reviews = self.get_reviews_detailall(resp)
-                pagetoken = rsp_getnextpagecnt(resp)
-            
-            return reviews, reviews_summ_df
-        else:
-            blank_df = pd.DataFrame()
-            return blank_df, blank_df
-        
-    def refreshtoken_again(self):
-        try:
-            reviews, reviews_summ_df = self.reviews_page_loop()
-            
-        except:
-            print("refresh token again!!!")
-            Token().refresh_token()
-            reviews, reviews_summ_df = self.reviews_page_loop()
-            
-        return reviews, reviews_summ_df
-
-def loop_shops_reviews():
-    """
-        Use the 'Reviews' class to retrieve reviewer names, comments, and ratings for locations.
-    """
-    
-    summ_list = []
-    detail_list = []
-    locations = Locations.read_locationsid()
-    location_list = (locations['account']+locations['name']).tolist()
-    # print(location_list)
-    
-    i = 0
-    for index, loc_id in locations.iterrows():
-        i += 1
-        sleep(i)
-        
-        rev_obj = Reviews(loc_id)
-        reviews_all, reviews_summ = rev_obj.refreshtoken_again()
-        summ_list.append(reviews_summ)
-        detail_list.append(reviews_all)
-        summ_df = pd.concat(summ_list, ignore_index=1).drop_duplicates(subset=['storeCode'])
-        detail_df = pd.concat(detail_list, ignore_index=1).drop_duplicates(subset=['reviewId'])
-    os.chdir(save_dir)
-    fuct_to_csv(summ_df, review_summ_filename)
-    fuct_to_csv(detail_df, review_detail_filename)
-    
-def loop_shops_reviews2():
-    """
-        Use the 'Reviews_bat' class to retrieve retrieves ratings and review data for locations.
-    """
-    
-    detail_list = []
-    summ_list = []
-    location_list = Locations.read_locationsid()
-
-    location_list = [v for k, v in location_list.groupby('account')]
-    for l in location_list:
-        account = l['account'][0]
-        location_list = l[['account', 'name']].apply(lambda x: '/'.join(x), axis=1)
-        for item in location_list:
-            detail_list.append(item)
-            rev_obj = Reviews_bat(detail_list, account)
-            rev_obj.reviews_bat_API(None)
-            reviews_all = rev_obj.refreshtoken_again()
-            summ_list.append(reviews_all)
-            detail_df = pd.concat(summ_list, ignore_index=1)
-        os.chdir(save_dir)
-        fuct_to_csv(detail_df, review_detail_filename)
-
-def loop_account():
-    """
-        Loops through multiple accounts and retrieves location data for each account.
-    """
-    
-    location_list = []
-    config_account = read_config(account_details)
-    accounts = config_account.get("accounts")
-    for account in accounts:
-        account_name = account.get("name")
-        df = Locations(account_name).get_locationsid()
-        location_list.append(df)
-        loc_df = pd.concat(location_list, ignore_index=1)
-    fuct_to_csv(loc_df, location_list_filename)    
-
-def main():
-    
-    # for refresh token (optional)
-    # Token().refresh_token()
-    
-    # for update locations list (optional)
-    # loop_account()
-    # Locations.read_locationsid()
-
-    # get reviews
-    # loop_shops_reviews()
-    loop_shops_reviews2()
-
-if __name__ == '__main__':  
-    print("start")
-    main()
-    print("end")
+"""
+This script automates the retrieval of location details and names from your Google Maps account. 
+It also fetches reviews and associated replies for each location, enabling streamlined analysis and management of customer feedback.
+
+- Connects to the Google Maps API to retrieve business location information.
+- Extracts customer reviews and their corresponding replies for better insights.
+- Supports scalable data collection for multiple business locations.
+- Provides a foundation for sentiment analysis, review trend tracking, or customer satisfaction evaluation.
+
+Usage:
+    python googlemaps_reviews.py [batch-reviews | reviews | locations | refresh-token] [--incremental] [--workers 4]
+                                 [--format csv] [--metrics run_metrics.json] [--no-cache] [--verbose]
+"""
+
+
+import os
+import sys
+import glob
+import math
+import json
+import time
+import shutil
+import logging
+import argparse
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from email.utils import parsedate_to_datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_utils import cli, files, http_client, metrics, pipeline
+from api_utils.rate_limit import RateLimiter
+from api_utils.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Set the file location and file name for saving
+config_dir = r'C:\Users\Vivian\Desktop\config_data'
+save_dir = r'C:\Users\Vivian\Desktop'
+location_list_filename = 'locations.csv' # in save_dir, written by the locations command and read by the reviews commands
+review_summ_filename = 'reviews_summ.csv'
+review_detail_filename = 'reviews_detail.csv'
+output_format = 'csv' # 'csv' (tab-separated) or 'parquet' (partitioned by storeCode, requires pyarrow)
+review_summ_columns = ['averageRating', 'totalReviewCount', 'storeCode']
+review_detail_columns = ['reviewId', 'starRating', 'comment', 'createTime', 'updateTime', 'replyUpdateTime', 'storeCode']
+checkpoint_filename = 'reviews_checkpoint.json' # newest review seen per location, and the locations finished by the current run
+metrics_filename = 'run_metrics.json' # latency per endpoint, stage timings and slowest locations of the run ('.prom' for Prometheus text), None to skip
+
+# Set how many locations are fetched at the same time (1 = one by one)
+max_workers = 4
+
+# Set how many locations are sent in one batchGetReviews request
+batch_size = 50
+star_rating_values = {'ONE': 1, 'TWO': 2, 'THREE': 3, 'FOUR': 4, 'FIVE': 5}
+
+# Set the request rate shared by all API calls (the default My Business quota is 300 requests per minute)
+api_qps = 5         # requests per second
+api_burst = 10      # requests allowed at once after an idle period
+api_max_retries = 5 # retries for a 429 / 503 response
+
+# Set how long API responses are served from the local response cache (seconds, 0 = always fetched), see api_utils.response_cache
+locations_cache_ttl = 86400 # the locations of an account
+reviews_cache_ttl = 3600    # the review pages of a location and of a batchGetReviews request
+
+# Refresh the access token this many seconds before it expires
+token_refresh_margin = 300
+
+# Set up Google Maps credentials and token
+refresh_token_file = r'\GoogleBusinessApi_refresh.txt'
+access_token_file = r'\GoogleBusinessApi_access.txt'
+account_details = './account.json'
+gcp_client = './client_secrets.json'
+
+# Set up Google Maps API url path
+refresh_token_url = 'https://accounts.google.com/o/oauth2/token'
+accounts_api = 'https://mybusinessaccountmanagement.googleapis.com/v1/accounts'
+locations_api = 'https://mybusinessbusinessinformation.googleapis.com/v1/account/locations'
+reviews_api = 'https://mybusiness.googleapis.com/v4/account/location/reviews'
+locations_api_bat = 'https://mybusiness.googleapis.com/v4/account/locations:batchGetReviews'
+
+def read_config(config_file: str):
+    with open(config_file, 'r', encoding='utf-8') as file:
+        data = json.load(file, strict = False)
+        return data
+
+def fuct_to_csv(df, fn):
+    """Save file to excel"""
+    df.to_csv(fn, sep='\t', encoding='utf_8_sig', date_format='string',
+              index=False, chunksize=10**5)
+
+class DictionaryColumn:
+    """A dictionary-encoded column: one integer code per row (an `array` of ``typecode``) and the list of distinct values, None is -1."""
+    def __init__(self, typecode):
+        self.codes = array(typecode)
+        self.values = []
+        self.index = {}
+    
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+    
+    def __iter__(self):
+        return (self.values[code] if code >= 0 else None for code in self.codes)
+    
+    def to_categorical(self):
+        return pd.Categorical.from_codes(np.frombuffer(self.codes, dtype=self.codes.typecode), categories=self.values)
+
+class ReviewColumns:
+    """
+        Column buffers for the reviews of a location or a batch, filled straight from the JSON pages instead of one dict per review,
+        so the reviews of a large account take much less memory until they are written.
+        
+        - The text fields are kept in one list per column, line breaks in the comments are replaced by spaces.
+        - 'starRating' (int8 codes) and 'storeCode' (int32 codes) are dictionary-encoded with `DictionaryColumn`.
+        - The reviewer and reply objects are dropped, only the time of the owner's reply is kept as 'replyUpdateTime',
+          for the reply rate of `reviews_analytics`.
+        - `append()`: Adds one review of an API page. `ratings()`: Returns the storeCode and star rating value of every review.
+        - `to_frame()`: Builds the review detail DataFrame once, 'starRating' and 'storeCode' are categorical columns.
+    """
+    text_columns = ['reviewId', 'comment', 'createTime', 'updateTime', 'replyUpdateTime']
+    
+    def __init__(self):
+        self.text = {col: [] for col in self.text_columns}
+        self.star_rating = DictionaryColumn('b')
+        self.store_code = DictionaryColumn('i')
+    
+    def __len__(self):
+        return len(self.star_rating.codes)
+    
+    def append(self, review, store_code=None):
+        comment = review.get('comment')
+        self.text['reviewId'].append(review.get('reviewId'))
+        self.text['comment'].append(comment.replace('\n', ' ') if isinstance(comment, str) else comment)
+        self.text['createTime'].append(review.get('createTime'))
+        self.text['updateTime'].append(review.get('updateTime'))
+        self.text['replyUpdateTime'].append(review.get('reviewReply', {}).get('updateTime'))
+        self.star_rating.append(review.get('starRating'))
+        self.store_code.append(store_code)
+    
+    def ratings(self):
+        return zip(self.store_code, (star_rating_values.get(star) for star in self.star_rating))
+    
+    def to_frame(self):
+        columns = {'reviewId': self.text['reviewId'], 'starRating': self.star_rating.to_categorical()}
+        for col in self.text_columns[1:]:
+            # a field missing from every review is left out, the same as building the DataFrame from records
+            if any(value is not None for value in self.text[col]):
+                columns[col] = self.text[col]
+        columns['storeCode'] = self.store_code.to_categorical()
+        return pd.DataFrame(columns)
+
+def rsp_getnextpagecnt(report):
+    """If there are multiple pages of data, retrieve the next page using the provided next page token."""
+    try:
+        nextpagecnt = report.get('nextPageToken')
+        # print(f'skip {nextpagecnt}')
+        return nextpagecnt
+    except Exception as e:
+        logger.warning('next page token: %s', e)
+        return ""
+
+rate_limiter = RateLimiter(api_qps, api_burst)
+
+def get_retry_after(response):
+    """Return the Retry-After header in seconds, it can be a number of seconds or an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+def api_request(method, url, **kwargs):
+    """
+        Send an API request with the cached access token, through the shared rate limiter.
+        - 401: the token is refreshed once and the same request is sent again.
+        - 429 / 503: the request is retried after the backoff of the rate limiter.
+        - Any other error status, or one left after the refresh and the retries, raises an HTTP error,
+          so a failed location is neither written nor checkpointed and the run fails.
+        - ``cache_ttl``: a fresh response of the response cache is returned without waiting for the rate limiter.
+    """
+    response = http_client.cached(method, url, **kwargs)
+    if response is not None:
+        return response
+    refreshed = False
+    attempt = 0
+    while True:
+        access_token = token_provider.get()
+        headers = {'Authorization': f'Bearer {access_token}'}
+        rate_limiter.acquire()
+        response = http_client.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401 and not refreshed:
+            logger.info('401 from %s, refresh token', url)
+            token_provider.refresh(access_token)
+            refreshed = True
+            continue
+        if response.status_code not in (429, 503) or attempt == api_max_retries:
+            response.raise_for_status()
+            return response
+        delay = rate_limiter.backoff(get_retry_after(response), attempt)
+        logger.warning('%s from %s, retry in %.1fs', response.status_code, url, delay)
+        attempt += 1
+
+# for read and refresh token if necessary
+class Token:
+    """
+        The class consolidates all functions related to token management, including reading, refreshing API.
+        ''refresh_token'' Refresh authentication tokens if necessary, returns the new token and its lifetime in seconds.
+        The API calls get the token through `token_provider`, which keeps it in memory.
+    """
+    def __init__(self):
+        self.config_gcp = read_config(gcp_client)
+        self.config = self.config_gcp.get('web')
+        self.clientid = self.config.get('client_id')
+        self.clientsecret = self.config.get('client_secret')
+
+    def read_refresh_token(self):
+        with open(config_dir + refresh_token_file, "r") as token_file:
+            token = token_file.read()
+        return token
+    
+    def refresh_token(self):
+        refresh_token = self.read_refresh_token()
+        payload = {
+            'client_id' : f'{self.clientid}',
+            'client_secret' : f'{self.clientsecret}',
+            'grant_type' : 'refresh_token',
+            'redirect_uri' : 'https%3A%2F%2Fdevelopers.google.com%2Foauthplayground',
+            'access_type' : 'offline',
+            'approval_prompt' : 'force',
+            'refresh_token' : f'{refresh_token}'
+            }
+        
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+    
+        response = http_client.request("POST", refresh_token_url, headers=headers, data=payload).text
+        # print(response)
+        data = json.loads(response)
+        refresh_token = data.get('access_token')
+        if refresh_token is None:
+            raise RuntimeError(f'refresh token failed: {response}')
+        with open(config_dir + access_token_file, 'w') as f:
+            f.write(refresh_token)
+        return refresh_token, data.get('expires_in', 3600)
+    
+    def read_access_token(self):
+        with open(config_dir + access_token_file, "r") as token_file:
+            token = token_file.read()
+        return token
+
+class TokenProvider:
+    """
+        The class keeps the access token and its expiry time in memory for the whole process.
+        
+        - `get()`: Returns the cached token, and refreshes it `token_refresh_margin` seconds before it expires.
+          The first call reads the token file, a file token is assumed to expire one hour after it was written.
+        - `refresh()`: Refreshes the token. The lock makes concurrent callers share one in-flight refresh,
+          a caller holding an old token gets the token refreshed by the other thread instead of refreshing again.
+    """
+    def __init__(self):
+        self.token = None
+        self.access_token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+    
+    def load(self):
+        self.token = Token()
+        token_path = config_dir + access_token_file
+        if os.path.exists(token_path):
+            self.access_token = self.token.read_access_token()
+            self.expires_at = os.path.getmtime(token_path) + 3600
+    
+    def get(self):
+        if self.access_token is not None and time.time() < self.expires_at - token_refresh_margin:
+            return self.access_token
+        with self.lock:
+            if self.token is None:
+                self.load()
+            if self.access_token is None or time.time() >= self.expires_at - token_refresh_margin:
+                self.refresh_locked()
+            return self.access_token
+    
+    def refresh(self, old_token=None):
+        with self.lock:
+            if self.token is None:
+                self.load()
+            # another thread already refreshed the token while this one was waiting
+            if old_token is None or self.access_token == old_token:
+                self.refresh_locked()
+            return self.access_token
+    
+    def refresh_locked(self):
+        logger.info('refresh token')
+        access_token, expires_in = self.token.refresh_token()
+        self.access_token = access_token
+        self.expires_at = time.time() + int(expires_in)
+
+token_provider = TokenProvider()
+
+class Locations:
+    """
+        The class is designed to retrieve and process location data from a Google account.
+        
+        - `locations_API()`: Fetches location data from the API by making a request using the account’s access token.
+        - `trans_location_records()`: Transforms the location records of the API response into a structured DataFrame by extracting and formatting the address information.
+          The records are flattened in one pass before the DataFrame is built, and the account name is appended.
+        - `get_locationsid()`: Calls the API to fetch all locations, handles pagination, and collects the location records, which are then transformed into a readable format using `trans_location_records()`.
+          The next page is requested in the background while the current page is collected.
+    """
+    def __init__(self, account):
+        self.location_list = []
+        self.account = account
+    
+    def locations_API(self, pagetoken):
+        url = locations_api.replace('account', self.account)
+        payload = {
+            'pageToken' : pagetoken,
+            'pageSize' : 100,
+            'orderBy' : 'storeCode desc',
+            'read_mask' : 'name,title,storeCode,storefront_address'
+            }
+        with metrics.stage('fetch'):
+            response = api_request("GET", url, params=payload, cache_ttl=locations_cache_ttl).text
+        with metrics.stage('parse'):
+            df = json.loads(response)
+        logger.debug('locations page account=%s locations=%d next_page=%s',
+                      self.account, len(df.get('locations', [])), df.get('nextPageToken') is not None)
+        return df
+    
+    def trans_location_records(self, locations):
+        # the address lines are padded to the longest address, the same as expanding them into columns
+        n_lines = max((len(location.get('storefrontAddress', {}).get('addressLines', [])) for location in locations), default=0)
+        rows = []
+        for location in locations:
+            address = location.get('storefrontAddress', {})
+            lines = address.get('addressLines', [])
+            address_line = ' '.join(list(lines) + [''] * (n_lines - len(lines)))
+            rows.append({
+                'account': self.account,
+                'name': location.get('name', ''),
+                'storeCode': location.get('storeCode', ''),
+                'title': location.get('title', ''),
+                'postalCode': address.get('postalCode', ''),
+                'address': address.get('administrativeArea', '') + address.get('locality', '') + address_line
+                })
+        rst_df = pd.DataFrame(rows, columns=["account", "name", "storeCode", "title", "postalCode", "address"])
+        return rst_df
+    
+    def get_locationsid(self):
+        self.location_list = []
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            resp = self.locations_API(None)
+            while True:
+                pagetoken = rsp_getnextpagecnt(resp)
+                next_page = prefetch.submit(self.locations_API, pagetoken) if pagetoken is not None else None
+                self.location_list.extend(resp.get('locations', []))
+                if next_page is None:
+                    break
+                resp = next_page.result()
+        
+        with metrics.stage('transform', key=self.account):
+            rst_df = self.trans_location_records(self.location_list)
+        return rst_df
+        
+    def locations_tocsv(self):
+        rst_df = self.get_locationsid()
+        fuct_to_csv(rst_df, os.path.join(save_dir, location_list_filename))
+
+    def read_locationsid():
+        df = pd.read_csv(os.path.join(save_dir, location_list_filename), sep='\t')
+        return df
+ 
+class Reviews_bat:
+    """
+    The class retrieves reviews for a batch of locations of one account with the batchGetReviews endpoint,
+    one request returns the reviews of up to `batch_size` locations.
+    
+    - `reviews_bat_API()`: Posts the request for all locations of the batch. Handles pagination using `pagetoken`.
+    - `get_reviews_detailall()`: Collects the reviews of one page into the `ReviewColumns` buffers, with the storeCode of the location of each review.
+    - `get_reviews_summ()`: Builds the summary of each location (average rating and review count) from the collected reviews.
+    - `fetch_pages()`: Loops through all available pages of the batch and collects their reviews.
+    - `to_frames()`: Returns the details and summary of the collected reviews in the same DataFrame format as the 'Reviews' class.
+    - `reviews_page_loop()`: `fetch_pages()` and `to_frames()` in one call.
+    """
+    
+    def __init__(self, locations_list, account):
+        # locations_list: the rows of 'locations.csv' in this batch, with the 'name' and 'storeCode' columns
+        self.account = account
+        self.location_names = [f'{account}/{name}' for name in locations_list['name']]
+        self.shopids = dict(zip(self.location_names, locations_list['storeCode']))
+        self.review_detail = ReviewColumns()
+
+    def reviews_bat_API(self, pagetoken):
+        url = locations_api_bat.replace('account', self.account)
+        
+        payload = {
+            "locationNames": self.location_names,
+            "pageSize": 50,
+            "pageToken": pagetoken,
+            "orderBy": "updateTime desc",
+            "ignoreRatingOnlyReviews": False
+            }
+        
+        with metrics.stage('fetch'):
+            response = api_request("POST", url, json=payload, cache_ttl=reviews_cache_ttl).text
+        with metrics.stage('parse'):
+            df = json.loads(response)
+        return df
+    
+    def get_reviews_detailall(self, reviews):
+        for location_review in reviews.get('locationReviews', []):
+            self.review_detail.append(location_review.get('review', {}), self.shopids.get(location_review.get('name')))
+    
+    def get_reviews_summ(self):
+        ratings = {shopid: [] for shopid in self.shopids.values()}
+        for shopid, stars in self.review_detail.ratings():
+            ratings.setdefault(shopid, []).append(stars)
+        rows = []
+        for shopid, values in ratings.items():
+            stars = [x for x in values if x is not None]
+            rows.append({
+                'averageRating': round(sum(stars) / len(stars), 1) if len(stars) > 0 else None,
+                'totalReviewCount': len(values),
+                'storeCode': shopid
+                })
+        return pd.DataFrame(rows)
+    
+    def fetch_pages(self):
+        logger.info('start batch of %d locations', len(self.location_names))
+        self.review_detail = ReviewColumns()
+        pagetoken = None
+        while True:
+            resp = self.reviews_bat_API(pagetoken)
+            self.get_reviews_detailall(resp)
+            pagetoken = rsp_getnextpagecnt(resp)
+            if pagetoken is None:
+                break
+    
+    def to_frames(self):
+        with metrics.stage('transform'):
+            reviews = self.review_detail.to_frame()
+            reviews_summ = self.get_reviews_summ()
+        return reviews, reviews_summ
+    
+    def reviews_page_loop(self):
+        self.fetch_pages()
+        return self.to_frames()
+
+class Reviews:
+    """
+    The class retrieves reviews detail, including reviewer names and comments for a specific location.
+    
+    - `reviews_API()`: Sends a request to the API to fetch reviews data for the location. Handles pagination using `pagetoken`.
+    - `get_reviews_detailall()`: Collects the reviews of one page into the `ReviewColumns` buffers, including comments and ratings.
+      With a high-water mark ``since``, it skips the reviews already seen and stops at the first older review, returning True.
+    - `reviews_detail_df()`: Builds the review detail DataFrame once from the collected reviews.
+    - `get_reviews_summ()`: Extracts and processes the summary information from the reviews data.
+    - `reviews_page_loop()`: Loops through all available pages of reviews and consolidates the details and summary into two DataFrames.
+    """
+    def __init__(self, location_id):
+        self.review_summ_list = []
+        self.review_detail = ReviewColumns()
+        self.account = location_id['account']
+        self.id = location_id['name']
+        self.shopid = location_id['storeCode']
+
+    def reviews_API(self, pagetoken):
+        url = reviews_api.replace('account', self.account).replace('location', self.id)
+        
+        payload = {
+            'pageToken' : pagetoken,
+            'pageSize' : 50,
+            'orderBy' : 'updateTime desc' # newest first, so an incremental run can stop at the first review already seen
+            }
+        with metrics.stage('fetch'):
+            response = api_request("GET", url, params=payload, cache_ttl=reviews_cache_ttl).text
+        with metrics.stage('parse'):
+            df = json.loads(response)
+        return df
+    
+    def get_reviews_detailall(self, reviews, since=None):
+        r_lists = reviews.get('reviews')
+        if r_lists is None:
+            r_lists = []
+        for r_list in r_lists:
+            if since is not None and is_seen_review(r_list, since):
+                # the reviews with the updateTime of the high-water mark can come in any order, stop after them
+                if pd.Timestamp(r_list.get('updateTime')) < pd.Timestamp(since['updateTime']):
+                    return True
+                continue
+            # line breaks in the comments are replaced here instead of on the whole DataFrame
+            self.review_detail.append(r_list, self.shopid)
+        return False
+    
+    def reviews_detail_df(self):
+        with metrics.stage('transform'):
+            rst_df = self.review_detail.to_frame()
+        return rst_df
+        
+    def get_reviews_summ(self, data):
+        js = data
+        sel_column = {x: js[x] for x in js if x not in {"reviews", "nextPageToken"}}
+        for k, v in sel_column.items():
+            pass
+        df = pd.DataFrame(sel_column.items()).set_index(0).T
+        df['storeCode'] = self.shopid
+        return df
+        
+    def reviews_page_loop(self, since=None):
+        logger.debug('start %s', self.shopid)
+        self.review_detail = ReviewColumns()
+        data = self.reviews_API(None)
+
+        if len(data) > 0:
+            reached = self.get_reviews_detailall(data, since)
+            reviews_summ_df = self.get_reviews_summ(data)
+            pagetoken = rsp_getnextpagecnt(data)
+            
+            # stop paginating once the reviews already seen are reached
+            while pagetoken != None and not reached:
+                resp = self.reviews_API(pagetoken)
+                reached = self.get_reviews_detailall(resp, since)
+                pagetoken = rsp_getnextpagecnt(resp)
+            
+            reviews = self.reviews_detail_df()
+            return reviews, reviews_summ_df
+        else:
+            blank_df = pd.DataFrame()
+            return blank_df, blank_df
+
+class ReviewsWriter:
+    """
+        The class streams the reviews of each location to the output files as soon as the location is finished,
+        so the memory stays flat and the finished locations are kept if the run stops halfway.
+        
+        - `write()`: Appends the detail and summary DataFrames of one location, skipping reviews and locations already written.
+        - `close()`: Finishes the output files of the run.
+        - ``fmt='csv'``: tab-separated CSV in the same format as `fuct_to_csv()`, the header is written once.
+        - ``fmt='parquet'``: a Parquet dataset for each output, partitioned by storeCode (one folder per location).
+        - ``append=True``: keeps the existing output files and adds to them, instead of starting new files.
+          The new summary of a location replaces its old one and an edited review replaces its old version
+          (Parquet: when the location is written, CSV: in `close()`), so storeCode and reviewId stay unique.
+    """
+    def __init__(self, fmt='csv', append=False):
+        self.fmt = fmt
+        self.append_mode = append
+        self.seen_shops = set()
+        if not append:
+            for fn in [review_summ_filename, review_detail_filename]:
+                if fmt == 'parquet' and os.path.isdir(os.path.splitext(fn)[0]):
+                    shutil.rmtree(os.path.splitext(fn)[0])
+                elif fmt == 'csv' and os.path.exists(fn):
+                    os.remove(fn)
+    
+    def append_csv(self, df, fn):
+        header = not os.path.exists(fn) or os.path.getsize(fn) == 0
+        df.to_csv(fn, sep='\t', encoding='utf_8_sig', date_format='string',
+                  index=False, mode='a', header=header)
+    
+    def append_parquet(self, df, fn):
+        # every call adds new part files under <fn>/storeCode=<code>/
+        df.to_parquet(os.path.splitext(fn)[0], partition_cols=['storeCode'], index=False)
+    
+    def upsert_parquet(self, df, fn, key):
+        # the old rows of the locations are written again with the new rows, then their old part files are removed,
+        # an interruption in between leaves duplicates which the next upsert of the location removes
+        base = os.path.splitext(fn)[0]
+        old_files, frames = [], []
+        for store in df['storeCode'].unique():
+            files = glob.glob(os.path.join(base, f'storeCode={store}', '*.parquet'))
+            if len(files) > 0:
+                old = pd.read_parquet(files).assign(storeCode=store)
+                frames.append(old[~old[key].isin(df[key])])
+                old_files += files
+        self.append_parquet(pd.concat(frames + [df], ignore_index=True) if len(frames) > 0 else df, fn)
+        for old_fn in old_files:
+            os.remove(old_fn)
+    
+    def append(self, df, fn, key):
+        if self.fmt == 'parquet' and self.append_mode:
+            self.upsert_parquet(df, fn, key)
+        elif self.fmt == 'parquet':
+            self.append_parquet(df, fn)
+        else:
+            self.append_csv(df, fn)
+    
+    def write(self, detail_df, summ_df):
+        with metrics.stage('write'):
+            # fixed columns, so every appended chunk lines up with the header
+            detail_df = detail_df.reindex(columns=review_detail_columns)
+            summ_df = summ_df.reindex(columns=review_summ_columns)
+            # a location written by an earlier call (e.g. listed twice) is not written again, review ids are unique
+            # per location, so only the locations of the run are kept instead of every review id
+            stores = set(detail_df['storeCode'].unique()) | set(summ_df['storeCode'].unique())
+            written = stores & self.seen_shops
+            if len(written) > 0:
+                detail_df = detail_df[~detail_df['storeCode'].isin(written)]
+                summ_df = summ_df[~summ_df['storeCode'].isin(written)]
+            self.seen_shops.update(stores)
+            detail_df = detail_df.drop_duplicates(subset=['reviewId'])
+            summ_df = summ_df.drop_duplicates(subset=['storeCode'])
+            
+            if len(summ_df) > 0:
+                self.append(summ_df, review_summ_filename, 'storeCode')
+            if len(detail_df) > 0:
+                self.append(detail_df, review_detail_filename, 'reviewId')
+    
+    def close(self):
+        if self.fmt == 'csv' and self.append_mode:
+            with metrics.stage('write'):
+                keep_last_rows(review_summ_filename, 'storeCode')
+                keep_last_rows(review_detail_filename, 'reviewId')
+
+def keep_last_rows(fn, key, chunksize=10**5):
+    """
+        Keep only the last row of each ``key`` in a CSV output, e.g. the newest version of an edited review.
+        Only the key column is held in memory, the file is rewritten in chunks only if a key appears more than once.
+    """
+    if not os.path.exists(fn) or os.path.getsize(fn) == 0:
+        return
+    read_args = {'sep': '\t', 'encoding': 'utf_8_sig', 'dtype': str, 'keep_default_na': False}
+    keep = ~pd.read_csv(fn, usecols=[key], **read_args)[key].duplicated(keep='last').to_numpy()
+    if keep.all():
+        return
+    tmp_fn = fn + '.tmp'
+    start = 0
+    for chunk in pd.read_csv(fn, chunksize=chunksize, **read_args):
+        chunk[keep[start:start + len(chunk)]].to_csv(tmp_fn, sep='\t', encoding='utf_8_sig', index=False,
+                                                     mode='w' if start == 0 else 'a', header=start == 0)
+        start += len(chunk)
+    os.replace(tmp_fn, fn)
+    logger.info('%s: %d rows replaced by newer rows', fn, len(keep) - keep.sum())
+
+def high_water_ids(since):
+    # checkpoints of older versions keep a single 'reviewId'
+    return set(since['reviewIds']) if 'reviewIds' in since else {since.get('reviewId')}
+
+def is_seen_review(review, since):
+    """Return True if the review is before the high-water mark ``since`` of its location, or one of the reviews at it."""
+    update_time = pd.Timestamp(review.get('updateTime'))
+    since_time = pd.Timestamp(since['updateTime'])
+    return update_time < since_time or (update_time == since_time and review.get('reviewId') in high_water_ids(since))
+
+def newest_review(detail_df):
+    """Return the high-water mark (newest `updateTime` and every `reviewId` with it) of a location's reviews."""
+    if len(detail_df) == 0 or 'updateTime' not in detail_df.columns:
+        return None
+    update_time = pd.to_datetime(detail_df['updateTime'], format='ISO8601')
+    newest = detail_df[update_time == update_time.max()]
+    return {'updateTime': newest['updateTime'].iloc[0], 'reviewIds': sorted(newest['reviewId'].astype(str))}
+
+class Checkpoint:
+    """
+        The class keeps the crawl progress in a JSON file, for incremental and resumable runs of `loop_shops_reviews()`.
+        
+        - `get()`: Returns the high-water mark of a location (newest `updateTime` and every `reviewId` with it), or None.
+        - `update()`: Saves the new high-water mark of a location and marks it as finished in the current run,
+          the reviews of a mark with the same `updateTime` are added to it.
+        - `is_finished()`: Returns True if an interrupted run already finished the location.
+        - `finish_run()`: Clears the finished locations once every location of the run is done.
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        data = read_config(fn) if os.path.exists(fn) else {}
+        self.stores = data.get('stores', {})
+        self.finished = set(data.get('finished', []))
+    
+    def save(self):
+        files.write_json(self.fn, {'stores': self.stores, 'finished': sorted(self.finished)}, indent=2)
+    
+    def get(self, shopid):
+        return self.stores.get(str(shopid))
+    
+    def update(self, shopid, newest):
+        old = self.get(shopid)
+        if newest is not None and old is not None and pd.Timestamp(newest['updateTime']) == pd.Timestamp(old['updateTime']):
+            newest = {'updateTime': newest['updateTime'], 'reviewIds': sorted(high_water_ids(old) | set(newest['reviewIds']))}
+        if newest is not None:
+            self.stores[str(shopid)] = newest
+        self.finished.add(str(shopid))
+        self.save()
+    
+    def is_finished(self, shopid):
+        return str(shopid) in self.finished
+    
+    def finish_run(self):
+        self.finished = set()
+        self.save()
+
+def get_shop_reviews(loc_id, since=None):
+    """Retrieve reviews detail and summary for a single location, only the reviews newer than ``since`` if given."""
+    rev_obj = Reviews(loc_id)
+    with metrics.stage('location', key=loc_id['storeCode']):
+        return rev_obj.reviews_page_loop(since)
+
+def loop_shops_reviews(max_workers=1, fmt=output_format, incremental=False):
+    """
+        Use the 'Reviews' class to retrieve reviewer names, comments, and ratings for locations.
+        ``max_workers`` sets how many locations are fetched at the same time.
+          - 1 loops through the locations one by one.
+          - More than 1 fetches the locations with a pool of worker threads, the pool size limits the concurrent requests.
+        The request rate itself is controlled by the shared `rate_limiter`.
+        Each location is written by `ReviewsWriter` as soon as it is finished, in the ``fmt`` output format.
+        
+        Every finished location is recorded in the `Checkpoint` file:
+          - ``incremental=True`` only fetches the reviews newer than the location's high-water mark and appends them to the existing output.
+          - If the previous run was interrupted, the locations it already finished are skipped and the output is appended.
+            Delete the checkpoint file to start over.
+    """
+    
+    locations = Locations.read_locationsid()
+    loc_ids = [loc_id for index, loc_id in locations.iterrows()]
+    os.chdir(save_dir)
+    checkpoint = Checkpoint(checkpoint_filename)
+    resume = len(checkpoint.finished) > 0
+    if resume:
+        logger.info('resume after %d finished locations', len(checkpoint.finished))
+        loc_ids = [loc_id for loc_id in loc_ids if not checkpoint.is_finished(loc_id['storeCode'])]
+    writer = ReviewsWriter(fmt, append=incremental or resume)
+    
+    def since(loc_id):
+        return checkpoint.get(loc_id['storeCode']) if incremental else None
+    
+    def save(loc_id, reviews_all, reviews_summ):
+        writer.write(reviews_all, reviews_summ)
+        checkpoint.update(loc_id['storeCode'], newest_review(reviews_all))
+    
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(get_shop_reviews, loc_id, since(loc_id)): loc_id for loc_id in loc_ids}
+            try:
+                # write the locations in the order they finish
+                for future in as_completed(futures):
+                    reviews_all, reviews_summ = future.result()
+                    save(futures[future], reviews_all, reviews_summ)
+            except BaseException:
+                # a failed location stops the run, the locations not started yet are not fetched
+                executor.shutdown(cancel_futures=True)
+                raise
+    else:
+        for loc_id in loc_ids:
+            reviews_all, reviews_summ = get_shop_reviews(loc_id, since(loc_id))
+            save(loc_id, reviews_all, reviews_summ)
+    writer.close()
+    checkpoint.finish_run()
+    
+def loop_shops_reviews2(fmt=output_format, max_workers=1):
+    """
+        Use the 'Reviews_bat' class to retrieve ratings and review data for locations.
+        The locations of each account are split into batches of `batch_size`, one batch is fetched with a single paginated request,
+        and the results are written by `ReviewsWriter` in the same format as `loop_shops_reviews()`.
+        The batches go through `pipeline.run()`: ``max_workers`` batches are fetched at the same time while
+        the DataFrames of the fetched batches are built and written.
+    """
+    
+    locations = Locations.read_locationsid()
+    os.chdir(save_dir)
+    writer = ReviewsWriter(fmt)
+    batches = [(account, i // batch_size, account_locations.iloc[i:i + batch_size])
+               for account, account_locations in locations.groupby('account')
+               for i in range(0, len(account_locations), batch_size)]
+    
+    def fetch(batch):
+        account, number, batch_locations = batch
+        rev_obj = Reviews_bat(batch_locations, account)
+        with metrics.stage('batch', key=f'{account} {number}'):
+            rev_obj.fetch_pages()
+        return rev_obj
+    
+    pipeline.run(batches, fetch,
+                 transform=lambda batch, rev_obj: rev_obj.to_frames(),
+                 sink=lambda batch, frames: writer.write(*frames),
+                 fetch_workers=max_workers)
+    writer.close()
+
+def get_account_locations(account_name):
+    """Retrieve the location data of a single account."""
+    df = Locations(account_name).get_locationsid()
+    logger.info('locations account=%s locations=%d', account_name, len(df))
+    return df
+
+def loop_account(max_workers=max_workers):
+    """
+        Loops through multiple accounts and retrieves location data for each account.
+        ``max_workers`` accounts are fetched at the same time, and the locations of all accounts are written to `location_list_filename` in `save_dir` once.
+    """
+    
+    config_account = read_config(account_details)
+    accounts = config_account.get("accounts")
+    account_names = [account.get("name") for account in accounts]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map() keeps the accounts in the same order as 'account.json'
+        location_list = list(executor.map(get_account_locations, account_names))
+    loc_df = pd.concat(location_list, ignore_index=1)
+    fuct_to_csv(loc_df, os.path.join(save_dir, location_list_filename))
+
+commands = ['batch-reviews', 'reviews', 'locations', 'refresh-token']
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch the locations and reviews of your Google My Business accounts.')
+    parser.add_argument('command', nargs='?', default='batch-reviews', choices=commands,
+                        help='batch-reviews: the reviews with batchGetReviews (default), reviews: the reviews location by location, '
+                             'locations: update the location list, refresh-token: refresh the access token')
+    parser.add_argument('--incremental', action='store_true', help='reviews: only fetch the reviews newer than the last run')
+    parser.add_argument('--workers', type=int, default=max_workers, help='locations / accounts fetched at the same time')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=output_format, help='format of the review outputs')
+    cli.add_run_arguments(parser, metrics_filename)
+    parser.add_argument('--verbose', action='store_true', help='log every API page')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger.info('start')
+    cli.start_run(args)
+    
+    if args.command == 'refresh-token':
+        token_provider.refresh()
+    elif args.command == 'locations':
+        loop_account(max_workers=args.workers)
+    elif args.command == 'reviews':
+        loop_shops_reviews(max_workers=args.workers, fmt=args.format, incremental=args.incremental)
+    else:
+        loop_shops_reviews2(fmt=args.format, max_workers=args.workers)
+    
+    cli.finish_run(args)
+    logger.info('end')
+
+if __name__ == '__main__':
+    main()
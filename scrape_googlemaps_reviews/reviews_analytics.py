@@ -0,0 +1,294 @@
+"""
+This script analyzes the reviews saved by `googlemaps_reviews` to find the stores with problems,
+without loading the whole review detail output into pandas for every question.
+
+- Keeps the reviews in a compact columnar form: categorical storeCode, int8 star ratings, parsed timestamps and a reply flag.
+- Maintains per-store and per-month aggregates (rating distribution, replies, rating sum), which are updated incrementally:
+  only the reviews appended to the output since the last update are read, an edited review replaces its old version.
+- Answers from the aggregates: store summary (average, rating distribution, reply rate), monthly trend with a rolling average,
+  and the low-rating alert list.
+- The compact reviews, the aggregates and the read position are saved in `analytics_dir`, so the next update continues from there.
+  A review detail output which was started over or rewritten since (e.g. by a run which is not incremental) is read again as a whole.
+
+Prerequisites:
+- The review detail output of `loop_shops_reviews()` / `loop_shops_reviews2()` (csv or parquet).
+- pyarrow for saving the analytics.
+
+Note:
+- The reply rate needs the 'replyUpdateTime' column, reviews saved by older versions are counted as not replied.
+
+Usage:
+    python reviews_analytics.py [--format csv] [--months 3] [--rebuild] [--metrics run_metrics.json]
+"""
+
+
+import io
+import os
+import sys
+import glob
+import json
+import hashlib
+import shutil
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import googlemaps_reviews as gmr
+from api_utils import cli, files, metrics
+from api_utils.lazy import lazy_import
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Set the analytics
+analytics_dir = None # compact reviews, aggregates and read position, None = 'reviews_analytics' in googlemaps_reviews.save_dir
+store_summary_filename = 'stores_summary.csv'
+alerts_filename = 'reviews_alerts.csv'
+low_rating = 2            # star ratings up to this value are low ratings
+rolling_months = 3        # months of the rolling average
+alert_months = 3          # the alerts look at the reviews of the last n months
+alert_min_reviews = 5     # stores with fewer rated reviews in the window are not alerted
+alert_max_average = 3.5   # alert a store whose average rating in the window is at or below this value
+alert_low_share = 0.3     # or whose share of low ratings in the window is at or above this value
+mark_size = 65536         # bytes of the csv output hashed at its start and before the read position, to notice a rewritten file
+
+def get_analytics_dir():
+    return os.path.join(gmr.save_dir, 'reviews_analytics') if analytics_dir is None else analytics_dir
+
+def compact_reviews(df):
+    """
+        Return the review detail records in the compact form, one row per reviewId (the newest version of an edited review).
+        A review without a star rating has 0 stars and is not counted in the averages.
+    """
+    df = df.drop_duplicates(subset=['reviewId'], keep='last')
+    create_time = pd.to_datetime(df['createTime'], format='ISO8601', utc=True)
+    reply_time = df['replyUpdateTime'] if 'replyUpdateTime' in df.columns else pd.Series(None, index=df.index)
+    return pd.DataFrame({
+        'reviewId': df['reviewId'].astype(str),
+        'storeCode': df['storeCode'].astype(str).astype('category'),
+        'stars': df['starRating'].map(gmr.star_rating_values).fillna(0).astype('int8'),
+        'createTime': create_time,
+        'updateTime': pd.to_datetime(df['updateTime'], format='ISO8601', utc=True),
+        'month': (create_time.dt.year * 100 + create_time.dt.month).astype('int32'),
+        'replied': reply_time.notna() & (reply_time.astype(str) != '')
+        }).set_index('reviewId')
+
+def monthly_counts(reviews):
+    """Return the counts of the compact reviews per storeCode and month (the month the review was written)."""
+    counts = pd.DataFrame({
+        'storeCode': reviews['storeCode'].astype(str),
+        'month': reviews['month'],
+        'reviews': 1,
+        'rated': (reviews['stars'] > 0).astype('int64'),
+        'stars_sum': reviews['stars'].astype('int64'),
+        'replied': reviews['replied'].astype('int64'),
+        **{f'star_{i}': (reviews['stars'] == i).astype('int64') for i in range(1, 6)}
+        })
+    return counts.groupby(['storeCode', 'month']).sum()
+
+def add_rates(df):
+    """Add the average rating, reply rate and rating distribution (share of each star rating) to the counts."""
+    df = df.copy()
+    rated = df['rated'].where(df['rated'] > 0)
+    df['average'] = (df['stars_sum'] / rated).round(2)
+    df['reply_rate'] = (df['replied'] / df['reviews'].where(df['reviews'] > 0)).round(3)
+    for i in range(1, 6):
+        df[f'share_{i}'] = (df[f'star_{i}'] / rated).round(3)
+    return df
+
+def file_mark(f, offset):
+    """Return a fingerprint of the first ``offset`` bytes of the open file ``f``: its inode and a hash of the start and of the end."""
+    digest = hashlib.sha1(str(os.fstat(f.fileno()).st_ino).encode())
+    for start in [0, max(offset - mark_size, 0)]:
+        f.seek(start)
+        digest.update(f.read(min(mark_size, offset)))
+    return digest.hexdigest()
+
+def month_index(months):
+    """Return every month (yyyymm) from the first to the last of ``months``."""
+    periods = pd.period_range(pd.Period(f'{min(months) // 100}-{min(months) % 100:02d}', 'M'),
+                              pd.Period(f'{max(months) // 100}-{max(months) % 100:02d}', 'M'), freq='M')
+    return [p.year * 100 + p.month for p in periods]
+
+class ReviewAnalytics:
+    """
+    The class keeps the compact reviews and their per-store, per-month aggregates.
+
+    - `add()`: Adds review detail records (e.g. of one location or one run), the aggregates of new and edited reviews are updated incrementally.
+    - `refresh()`: Adds the reviews appended to the review detail output since the last refresh.
+    - `stores()`: Returns the summary of every store, the average rating, rating distribution and reply rate.
+    - `trend()`: Returns the monthly counts of a store (or all stores) with the average and the `rolling_months` rolling average.
+    - `alerts()`: Returns the stores with low ratings in the last `alert_months` months.
+    - `save()` / `load()`: Saves and loads the compact reviews, the aggregates and the read position in `analytics_dir`.
+    """
+    def __init__(self):
+        self.reviews = compact_reviews(pd.DataFrame(columns=['reviewId', 'storeCode', 'starRating', 'createTime', 'updateTime']))
+        self.monthly = monthly_counts(self.reviews)
+        self.position = {}
+        self.generation = 0 # number of the last save
+
+    def add(self, detail_df):
+        """Add review detail records, returns the number of new or edited reviews."""
+        if len(detail_df) == 0:
+            return 0
+        new = compact_reviews(detail_df)
+        # the same (or an older) version of a review already counted is skipped, an edited review replaces its old version,
+        # and so does a reply added or removed later (the reply does not change the updateTime of the review)
+        old_time = self.reviews['updateTime'].reindex(new.index)
+        old_replied = self.reviews['replied'].reindex(new.index)
+        unchanged = (new['updateTime'] < old_time) | ((new['updateTime'] == old_time) & (new['replied'] == old_replied))
+        new = new[~unchanged]
+        if len(new) == 0:
+            return 0
+        old = self.reviews[self.reviews.index.isin(new.index)]
+
+        counts = self.monthly.add(monthly_counts(new), fill_value=0)
+        if len(old) > 0:
+            counts = counts.sub(monthly_counts(old), fill_value=0)
+        self.monthly = counts[counts['reviews'] > 0].astype('int64').sort_index()
+
+        stores = self.reviews['storeCode'].cat.categories.union(new['storeCode'].cat.categories)
+        kept = self.reviews[~self.reviews.index.isin(new.index)]
+        self.reviews = pd.concat([kept.astype({'storeCode': pd.CategoricalDtype(stores)}),
+                                  new.astype({'storeCode': pd.CategoricalDtype(stores)})])
+        return len(new)
+
+    def refresh(self, fmt=None, directory=None):
+        """
+            Add the reviews appended to the review detail output since the last refresh, returns the number of new or edited reviews.
+            The output is in `googlemaps_reviews.output_format` and `googlemaps_reviews.save_dir` by default.
+            - csv: only the bytes after the last read position are parsed. The whole file is read again if the bytes before
+              the position changed (the file was started over or rewritten), the reviews already counted are skipped.
+            - parquet: only the part files not read before are loaded.
+        """
+        fmt = gmr.output_format if fmt is None else fmt
+        directory = gmr.save_dir if directory is None else directory
+        fn = os.path.join(directory, gmr.review_detail_filename)
+        if fmt == 'parquet':
+            files = sorted(glob.glob(os.path.join(os.path.splitext(fn)[0], '*', '*.parquet')))
+            read = set(self.position.get('files', []))
+            frames = []
+            for file in files:
+                if file in read:
+                    continue
+                df = pd.read_parquet(file)
+                # the partition column is in the folder name storeCode=<code>
+                df['storeCode'] = os.path.basename(os.path.dirname(file)).split('=', 1)[1]
+                frames.append(df)
+            self.position = {'files': files}
+            detail_df = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+        else:
+            if not os.path.exists(fn):
+                return 0
+            offset = self.position.get('offset', 0) if self.position.get('file') == os.path.abspath(fn) else 0
+            with open(fn, 'rb') as f:
+                if offset > 0 and (os.fstat(f.fileno()).st_size < offset or file_mark(f, offset) != self.position.get('mark')):
+                    # not the file read before (e.g. a run which is not incremental started it over), read it from the beginning
+                    logger.info('%s was rewritten, reading it again', fn)
+                    offset = 0
+                f.seek(0)
+                header = f.readline().decode('utf_8_sig').rstrip('\r\n').split('\t')
+                f.seek(max(offset, f.tell()))
+                data = f.read()
+                end = f.tell()
+                self.position = {'file': os.path.abspath(fn), 'offset': end, 'mark': file_mark(f, end)}
+            detail_df = pd.read_csv(io.BytesIO(data), sep='\t', names=header, header=None, dtype=str) if len(data) > 0 else pd.DataFrame()
+        added = self.add(detail_df)
+        logger.info('%d new or edited reviews, %d reviews of %d stores', added, len(self.reviews), self.reviews['storeCode'].nunique())
+        return added
+
+    def stores(self):
+        """Return the summary of every store, sorted by the average rating (lowest first)."""
+        df = add_rates(self.monthly.groupby(level='storeCode').sum())
+        return df.sort_values('average')
+
+    def trend(self, store=None):
+        """Return the monthly counts of a store (all stores if None), with the `rolling_months` rolling average."""
+        counts = self.monthly if store is None else self.monthly[self.monthly.index.get_level_values('storeCode') == str(store)]
+        counts = counts.groupby(level='month').sum()
+        if len(counts) == 0:
+            return add_rates(counts)
+        # months without reviews are kept as 0, so the rolling window always covers `rolling_months` months
+        counts = counts.reindex(month_index(counts.index), fill_value=0)
+        counts.index.name = 'month'
+        df = add_rates(counts)
+        rolling = counts[['stars_sum', 'rated']].rolling(rolling_months, min_periods=1).sum()
+        df['rolling_average'] = (rolling['stars_sum'] / rolling['rated'].where(rolling['rated'] > 0)).round(2)
+        return df
+
+    def alerts(self, months=alert_months):
+        """Return the stores whose average or share of low ratings in the last ``months`` months reaches the alert thresholds."""
+        if len(self.monthly) == 0:
+            return add_rates(self.monthly)
+        last_month = month_index(self.monthly.index.get_level_values('month'))[-months:]
+        window = self.monthly[self.monthly.index.get_level_values('month').isin(last_month)]
+        df = add_rates(window.groupby(level='storeCode').sum())
+        df['low_ratings'] = df[[f'star_{i}' for i in range(1, low_rating + 1)]].sum(axis=1)
+        df['low_share'] = (df['low_ratings'] / df['rated'].where(df['rated'] > 0)).round(3)
+        alert = (df['rated'] >= alert_min_reviews) & ((df['average'] <= alert_max_average) | (df['low_share'] >= alert_low_share))
+        return df[alert].sort_values(['average', 'low_share'], ascending=[True, False])
+
+    def save(self, directory=None):
+        """
+            Save the analytics in ``directory``. The compact reviews and the aggregates go to new files, which position.json
+            names together with the read position. position.json is replaced last, so an interrupted save leaves the last saved analytics.
+        """
+        directory = get_analytics_dir() if directory is None else directory
+        os.makedirs(directory, exist_ok=True)
+        generation = self.generation + 1
+        saved = {'reviews': f'reviews.{generation}.parquet', 'monthly': f'monthly.{generation}.parquet'}
+        self.reviews.to_parquet(os.path.join(directory, saved['reviews']))
+        self.monthly.to_parquet(os.path.join(directory, saved['monthly']))
+        files.write_json(os.path.join(directory, 'position.json'), {'generation': generation, **saved, 'position': self.position})
+        self.generation = generation
+        for fn in glob.glob(os.path.join(directory, 'reviews*.parquet')) + glob.glob(os.path.join(directory, 'monthly*.parquet')):
+            if os.path.basename(fn) not in saved.values():
+                os.remove(fn)
+
+    @classmethod
+    def load(cls, directory=None):
+        """Return the saved analytics in `analytics_dir`, or empty analytics if nothing was saved yet."""
+        directory = get_analytics_dir() if directory is None else directory
+        analytics = cls()
+        if os.path.exists(os.path.join(directory, 'position.json')):
+            with open(os.path.join(directory, 'position.json'), encoding='utf-8') as f:
+                saved = json.load(f)
+            if 'position' not in saved:
+                # saved by an older version, only the read position next to reviews.parquet and monthly.parquet
+                saved = {'generation': 0, 'reviews': 'reviews.parquet', 'monthly': 'monthly.parquet', 'position': saved}
+            analytics.reviews = pd.read_parquet(os.path.join(directory, saved['reviews']))
+            analytics.monthly = pd.read_parquet(os.path.join(directory, saved['monthly']))
+            analytics.position = saved['position']
+            analytics.generation = saved['generation']
+        return analytics
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Update the review analytics and save the store summary and the low-rating alerts.')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None, help='format of the review detail output (default: output_format of googlemaps_reviews)')
+    parser.add_argument('--months', type=int, default=alert_months, help='the alerts look at the reviews of the last n months')
+    parser.add_argument('--rebuild', action='store_true', help='discard the saved analytics and read the whole review detail output again')
+    cli.add_run_arguments(parser, cache=False)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.rebuild and os.path.exists(get_analytics_dir()):
+        shutil.rmtree(get_analytics_dir())
+    with metrics.stage('refresh'):
+        analytics = ReviewAnalytics.load()
+        analytics.refresh(args.format)
+        analytics.save()
+
+    os.chdir(gmr.save_dir)
+    with metrics.stage('write'):
+        gmr.fuct_to_csv(analytics.stores().reset_index(), store_summary_filename)
+        alerts = analytics.alerts(args.months)
+        gmr.fuct_to_csv(alerts.reset_index(), alerts_filename)
+    logger.info('%d stores with low ratings in the last %d months', len(alerts), args.months)
+    for store, row in alerts.iterrows():
+        logger.info('%s average %.2f, %d low ratings of %d', store, row['average'], row['low_ratings'], row['rated'])
+    cli.finish_run(args)
+
+if __name__ == '__main__':
+    main()